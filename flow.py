@@ -1,77 +1,131 @@
 from pocketflow import Node, Flow, BatchNode
+import atexit
 import os
-import json  # Add JSON support
+import json  # Kept for human-friendly pretty printing in logs
 import logging
-from datetime import datetime
+import logging.handlers
+import queue
+import re
+import time
+
+try:
+    # C/SIMD-accelerated parser; noticeably faster on KB-sized
+    # reasoning/operations payloads from the LLM
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import lru_cache
+from operator import itemgetter
+from pathlib import PurePath
 from typing import List, Dict, Any, Tuple
 
-# Import utility functions
-from utils.call_llm import call_llm
-from utils.read_file import read_file
-from utils.delete_file import delete_file
-from utils.replace_file import replace_file
-from utils.search_ops import grep_search
-from utils.dir_ops import list_dir
-from utils.run_command import run_command, get_user_approval, get_streamlit_approval
+# Import utility functions. Only the modules every session needs are loaded
+# eagerly; tool-specific utilities are imported inside each node's exec so a
+# session that never runs them skips their (transitive) import cost.
+from utils.llm_cache import cached_call_llm
 from utils.context_manager import ContextManager
 
-# Set up logging
+# Set up logging through a queue so the console/file writes happen on a
+# background listener thread instead of blocking prep/post on disk IO
+_log_queue = queue.SimpleQueue()
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('coding_agent.log')
-    ]
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
+)
+_log_listener = logging.handlers.QueueListener(
+    _log_queue,
+    logging.StreamHandler(),
+    logging.FileHandler('coding_agent.log'),
+    respect_handler_level=True
 )
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger('coding_agent')
 
 context_manager = ContextManager()
 
-#############################################
-# Main Decision Agent Node
-#############################################
-class MainDecisionAgent(Node):
-    def prep(self, shared: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
-        # Get user query and history
-        user_query = shared.get("user_query", "")
-        history = shared.get("history", [])
-        
-        # Store conversation history in instance for access in exec
-        self._conversation_history = shared.get("conversation_history", [])
-        
-        return user_query, history
-    
-    def exec(self, inputs: Tuple[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
-        user_query, history = inputs
-        logger.info(f"MainDecisionAgent: Analyzing user query: {user_query}")
+@dataclass(slots=True)
+class HistoryEntry:
+    """
+    One action in shared["history"]. Slots halve the per-entry memory of the
+    old 5-key dict; the mapping-protocol methods keep dict-style consumers
+    (context manager formatting) working unchanged.
+    """
+    tool: str
+    reason: str
+    params: Dict[str, Any]
+    result: Any = None
+    timestamp_ns: int = 0
+    file_content: Any = None  # Set by ReadTargetFileNode for the edit flow
 
-        # Use context manager to get optimized history
-        history_str = context_manager.get_contextual_history(history, user_query)
-        
-        # Get conversation history from shared state if available
-        conversation_history = getattr(self, '_conversation_history', [])
-        
-        # Format conversation history for context
-        conversation_context = ""
-        if conversation_history:
-            conversation_context = "\n\nPrevious conversation context:\n"
-            # Show last 3 conversations for context
-            recent_conversations = conversation_history[-3:]
-            for i, conv in enumerate(recent_conversations):
-                conversation_context += f"\nPrevious Query {i+1}: {conv['user_query']}\n"
-                conversation_context += f"Previous Response {i+1}: {conv['response'][:200]}{'...' if len(conv['response']) > 200 else ''}\n"
-        
-        # Create prompt for the LLM using JSON format
-        prompt = f"""You are a coding assistant that helps modify and navigate code. Given the following request, 
-decide which tool to use from the available options.
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        setattr(self, key, value)
 
-User request: {user_query}
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
 
-Here are the actions you performed for this current request:
-history_str: {history_str}
-conversation_context: {conversation_context}
+def _current_action(shared: Dict[str, Any]) -> HistoryEntry:
+    """Return the most recent history entry (the action currently executing)."""
+    history = shared.get("history")
+    if not history:
+        raise ValueError("No history found")
+    return history[-1]
+
+def _validate_operations(operations: List[Dict[str, Any]], total_lines: int) -> None:
+    """
+    Validate LLM edit operations in a single pass, fetching each field once.
+    Raises ValueError naming the first offending operation.
+    """
+    for idx, op in enumerate(operations):
+        start_line = op.get("start_line")
+        end_line = op.get("end_line")
+        if start_line is None:
+            raise ValueError(f"Operation {idx}: start_line is missing")
+        if end_line is None:
+            raise ValueError(f"Operation {idx}: end_line is missing")
+        if "replacement" not in op:
+            raise ValueError(f"Operation {idx}: replacement is missing")
+        if not 1 <= start_line <= total_lines:
+            raise ValueError(f"Operation {idx}: start_line out of range: {start_line}")
+        if not 1 <= end_line <= total_lines:
+            raise ValueError(f"Operation {idx}: end_line out of range: {end_line}")
+        if start_line > end_line:
+            raise ValueError(f"Operation {idx}: start_line > end_line: {start_line} > {end_line}")
+
+def _resolve_path(shared: Dict[str, Any], path: str) -> str:
+    """
+    Join a tool path onto the working directory. The PurePath base is built
+    once per flow run and cached on shared, avoiding a fresh os.path.join
+    parse on every tool call.
+    """
+    base = shared.get("_working_dir_path")
+    if base is None:
+        base = PurePath(shared.get("working_dir", ""))
+        shared["_working_dir_path"] = base
+    return str(base / path)
+
+# Precompiled patterns for pulling JSON out of LLM responses.
+# Greedy matching (.*) instead of lazy (.*?) matches to the LAST ``` to
+# handle nested backticks inside the JSON block.
+_JSON_BLOCK_RE = re.compile(r'```json\s*(.*)\s*```', re.DOTALL | re.IGNORECASE)
+
+# Static tool catalog for MainDecisionAgent, built once at import time.
+# Keeping this block FIRST in the prompt and byte-identical across calls
+# maximizes the prefix length eligible for provider-side prompt caching;
+# the volatile parts (query, history) go in a clearly delimited suffix.
+_TOOL_CATALOG_PROMPT = """You are a coding assistant that helps modify and navigate code. Given the following request,
+decide which tool to use from the available options.
 
 Available tools:
 1. read_file: Read content from a file
@@ -82,7 +136,19 @@ Available tools:
      params:
        target_file: main.py
 
-2. edit_file: Make changes to a file
+2. read_files: Read several files in one call
+   - Parameters: target_files (list of paths)
+   - Prefer this over repeated read_file calls when you already know every
+     file you need; the files are read in parallel
+   - Example:
+     tool: read_files
+     reason: I need the flow definition and its helper module together to trace the call
+     params:
+       target_files:
+         - flow.py
+         - utils/read_file.py
+
+3. edit_file: Make changes to a file
    - Parameters: target_file (path), instructions, code_edit
    - Code_edit_instructions:
        - The code changes with context, following these rules:
@@ -99,12 +165,12 @@ Available tools:
        instructions: Add try-except block around the file reading operation
        code_edit: |
             // ... existing file reading code ...
-            function newEdit() {{
+            function newEdit() {
                 // new code here
-            }}
+            }
             // ... existing file reading code ...
 
-3. delete_file: Remove a file
+4. delete_file: Remove a file
    - Parameters: target_file (path)
    - Example:
      tool: delete_file
@@ -112,7 +178,7 @@ Available tools:
      params:
        target_file: temp.txt
 
-4. grep_search: Search for patterns in files
+5. grep_search: Search for patterns in files
    - Parameters: query, case_sensitive (optional), include_pattern (optional), exclude_pattern (optional)
    - Example:
      tool: grep_search
@@ -122,7 +188,7 @@ Available tools:
        include_pattern: "*.py"
        case_sensitive: false
 
-5. list_dir: List contents of a directory
+6. list_dir: List contents of a directory
    - Parameters: relative_workspace_path
    - Example:
      tool: list_dir
@@ -131,7 +197,7 @@ Available tools:
        relative_workspace_path: utils
    - Result: Returns a tree visualization of the directory structure
 
-6. run_command: Execute a shell command (requires user approval)
+7. run_command: Execute a shell command (requires user approval)
    - Parameters: command, reason
    - Use ONLY when other tools cannot satisfy the requirement
    - Requires explicit user approval before execution
@@ -142,42 +208,85 @@ Available tools:
        command: pip install requests
        reason: The code requires the requests library but it's not installed
 
-7. finish: End the process and provide final response
+8. finish: End the process and provide final response
    - Parameters: final_response (required) - The complete final response to the user
    - Example:
      tool: finish
      reason: I have completed the requested task of finding all logger instances
-     params: {{
+     params: {
        "final_response": "I found 3 logger instances in your codebase: one in main.py at line 15, one in utils/logging.py at line 8, and one in flow.py at line 28. All are properly configured."
-     }}
+     }
 
 Respond with a JSON object containing:
 ```json
-{{
-  "tool": "one of: read_file, edit_file, delete_file, grep_search, list_dir, run_command, finish",
+{
+  "tool": "one of: read_file, read_files, edit_file, delete_file, grep_search, list_dir, run_command, finish",
   "reason": "detailed explanation of why you chose this tool and what you intend to do. If you chose finish, explain why no more actions are needed. If you chose run_command, explain why other tools cannot satisfy the requirement and what the command will accomplish.",
-  "params": {{
+  "params": {
     "parameter_name": "parameter_value"
-  }}
-}}
+  }
+}
 ```
 
 IMPORTANT: Ensure proper JSON indentation in your response. When including code examples in the reason field, maintain correct indentation within the JSON string. Consider the previous conversation context when making decisions.
 
 If you believe no more actions are needed, use "finish" as the tool and explain why in the reason. For the finish tool, you MUST provide a comprehensive final_response parameter that summarizes what you accomplished, what was found or modified, and any next steps the user might want to take. This final_response should be written directly to the user as if you are speaking to them.
 
-Use "run_command" ONLY as a last resort when other tools cannot accomplish the task.
-"""
+Use "run_command" ONLY as a last resort when other tools cannot accomplish the task."""
+
+# Pre-sliced segments of the dynamic suffix; exec only concatenates, so no
+# placeholder substitution or f-string formatting runs per turn. The static
+# catalog travels separately as the provider-side prompt-caching prefix.
+_PROMPT_QUERY_HEAD = "\n\n<<DYNAMIC>>\nUser request: "
+_PROMPT_HISTORY_HEAD = "\n\nHere are the actions you performed for this current request:\nhistory_str: "
+_PROMPT_CONVERSATION_HEAD = "\nconversation_context: "
+
+#############################################
+# Main Decision Agent Node
+#############################################
+class MainDecisionAgent(Node):
+    def prep(self, shared: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+        # Get user query and history (initialized once per flow run)
+        user_query = shared.get("user_query", "")
+        history = shared.setdefault("history", [])
+        
+        # Store conversation history in instance for access in exec
+        self._conversation_history = shared.get("conversation_history", [])
+        
+        return user_query, history
+    
+    def exec(self, inputs: Tuple[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+        user_query, history = inputs
+        logger.info(f"MainDecisionAgent: Analyzing user query: {user_query}")
+
+        # Use context manager to get optimized history
+        history_str = context_manager.get_contextual_history(history, user_query)
+        
+        # Get conversation history from shared state if available
+        conversation_history = getattr(self, '_conversation_history', [])
         
-        # Call LLM to decide action
-        response = call_llm(prompt, caller="MainDecisionAgent.exec")
+        # Format conversation history for context (last 3 exchanges, memoized)
+        conversation_context = context_manager.get_recent_conversation_context(conversation_history)
+        
+        # Compose the volatile suffix (query, history, conversation context);
+        # the byte-identical tool catalog is sent as the cacheable prefix so
+        # the provider reuses its prefill KV cache across turns
+        prompt = "".join((
+            _PROMPT_QUERY_HEAD, user_query,
+            _PROMPT_HISTORY_HEAD, history_str,
+            _PROMPT_CONVERSATION_HEAD, conversation_context,
+        ))
+
+        # Call LLM to decide action (content-hash cached for deterministic re-runs)
+        response = cached_call_llm(prompt, caller="MainDecisionAgent.exec",
+                                   cache_prefix=_TOOL_CATALOG_PROMPT)
 
         # Extract JSON from response using more robust parsing
         json_content = self._extract_json_from_response(response)
         
         if json_content:
-            decision = json.loads(json_content)
-            
+            decision = _json_loads(json_content)
+
             # Validate the required fields
             assert "tool" in decision, "Tool name is missing"
             assert "reason" in decision, "Reason is missing"
@@ -198,11 +307,7 @@ Use "run_command" ONLY as a last resort when other tools cannot accomplish the t
         Extract JSON from LLM response. The LLM typically wraps JSON in ```json blocks.
         Use greedy matching to get the longest/last ``` to handle nested backticks.
         """
-        import re
-        
-        # Use greedy matching (.*) instead of lazy (.*?) to match to the LAST ```
-        json_pattern = r'```json\s*(.*)\s*```'
-        match = re.search(json_pattern, response, re.DOTALL | re.IGNORECASE)
+        match = _JSON_BLOCK_RE.search(response)
         if match:
             return match.group(1).strip()
         
@@ -216,18 +321,17 @@ Use "run_command" ONLY as a last resort when other tools cannot accomplish the t
     def post(self, shared: Dict[str, Any], prep_res: Any, exec_res: Dict[str, Any]) -> str:
         logger.info(f"MainDecisionAgent: Selected tool: {exec_res['tool']}")
         
-        # Initialize history if not present
-        if "history" not in shared:
-            shared["history"] = []
-        
+        # Initialize history once and reuse the reference
+        history = shared.setdefault("history", [])
+
         # Add this action to history
-        shared["history"].append({
-            "tool": exec_res["tool"],
-            "reason": exec_res["reason"],
-            "params": exec_res.get("params", {}),
-            "result": None,  # Will be filled in by action nodes
-            "timestamp": datetime.now().isoformat()
-        })
+        history.append(HistoryEntry(
+            tool=exec_res["tool"],
+            reason=exec_res["reason"],
+            params=exec_res.get("params", {}),
+            result=None,  # Will be filled in by action nodes
+            timestamp_ns=time.time_ns()
+        ))
         
         # Return the action to take
         return exec_res["tool"]
@@ -238,27 +342,24 @@ Use "run_command" ONLY as a last resort when other tools cannot accomplish the t
 class ReadFileAction(Node):
     def prep(self, shared: Dict[str, Any]) -> str:
         # Get parameters from the last history entry
-        history = shared.get("history", [])
-        if not history:
-            raise ValueError("No history found")
-        
-        last_action = history[-1]
-        file_path = last_action["params"].get("target_file")
+        last_action = _current_action(shared)
+        file_path = last_action.params.get("target_file")
         
         if not file_path:
             raise ValueError("Missing target_file parameter")
         
         # Ensure path is relative to working directory
-        working_dir = shared.get("working_dir", "")
-        full_path = os.path.join(working_dir, file_path) if working_dir else file_path
+        full_path = _resolve_path(shared, file_path)
         
         # Use the reason for logging instead of explanation
-        reason = last_action.get("reason", "No reason provided")
+        reason = last_action.reason
         logger.info(f"ReadFileAction: {reason}")
         
         return full_path
     
     def exec(self, file_path: str) -> Tuple[str, bool]:
+        from utils.read_file import read_file
+
         # Call read_file utility which returns a tuple of (content, success)
         return read_file(file_path)
     
@@ -266,45 +367,112 @@ class ReadFileAction(Node):
         # Unpack the tuple returned by read_file()
         content, success = exec_res
         
+        # Bind the history once; both branches write the same entry
+        history = shared.get("history")
+
         # Add file content to context manager for deduplication
         if success and content:
             content_info = context_manager.add_file_content(prep_res, content)
-            
+
             # Update the result in the last history entry
-            history = shared.get("history", [])
             if history:
-                history[-1]["result"] = {
+                history[-1].result = {
                     "success": success,
                     "content_info": content_info
                 }
         else:
             # Update the result in the last history entry
-            history = shared.get("history", [])
             if history:
-                history[-1]["result"] = {
+                history[-1].result = {
                     "success": success,
                     # store error in message to surface clearly in summaries
                     "message": content
                 }
 
+#############################################
+# Batch Read Files Node
+#############################################
+class BatchReadFilesNode(BatchNode):
+    """
+    Read several files in one turn, overlapping the blocking file IO in a
+    thread pool. ReadFileAction remains the thin single-file path; this node
+    handles history entries that carry a target_files list.
+    """
+    def prep(self, shared: Dict[str, Any]) -> List[str]:
+        # Get parameters from the last history entry
+        last_action = _current_action(shared)
+        file_paths = last_action.params.get("target_files")
+
+        if not file_paths:
+            # Fall back to the single-file parameter for compatibility
+            single = last_action.params.get("target_file")
+            if not single:
+                raise ValueError("Missing target_files parameter")
+            file_paths = [single]
+
+        # Use the reason for logging instead of explanation
+        reason = last_action.reason
+        logger.info(f"BatchReadFilesNode: {reason}")
+
+        # Ensure paths are relative to working directory
+        return [_resolve_path(shared, p) for p in file_paths]
+
+    def exec(self, file_path: str) -> Tuple[str, str, bool]:
+        from utils.read_file import read_file
+
+        content, success = read_file(file_path)
+        return file_path, content, success
+
+    def _exec(self, items: List[str]) -> List[Tuple[str, str, bool]]:
+        # Overlap the per-file open/read syscalls in a thread pool instead of
+        # the sequential per-item mapping BatchNode does by default
+        if not items:
+            return []
+        results = {}
+        with ThreadPoolExecutor(max_workers=min(32, len(items))) as executor:
+            # Node._exec runs one item through the usual retry wrapper
+            futures = {executor.submit(Node._exec, self, p): p for p in items}
+            for future in as_completed(futures):
+                path, content, success = future.result()
+                results[futures[future]] = (path, content, success)
+        # Preserve the requested order
+        return [results[p] for p in items]
+
+    def post(self, shared: Dict[str, Any], prep_res: List[str], exec_res_list: List[Tuple[str, str, bool]]) -> str:
+        # Hash successful reads in bulk so the digests overlap, then stitch
+        # the content infos back into the per-file results in order
+        successful = [(fp, c) for fp, c, ok in exec_res_list if ok and c]
+        content_infos = iter(context_manager.add_file_contents_bulk(successful))
+
+        read_results = []
+        for file_path, content, success in exec_res_list:
+            if success and content:
+                read_results.append({"success": success, "content_info": next(content_infos)})
+            else:
+                read_results.append({"success": success, "message": content})
+
+        # Update the result in the last history entry
+        history = shared.get("history")
+        if history:
+            history[-1].result = {
+                "success": all(r["success"] for r in read_results),
+                "files": read_results
+            }
+
 #############################################
 # Grep Search Action Node
 #############################################
 class GrepSearchAction(Node):
     def prep(self, shared: Dict[str, Any]) -> Dict[str, Any]:
         # Get parameters from the last history entry
-        history = shared.get("history", [])
-        if not history:
-            raise ValueError("No history found")
-        
-        last_action = history[-1]
-        params = last_action["params"]
+        last_action = _current_action(shared)
+        params = last_action.params
         
         if "query" not in params:
             raise ValueError("Missing query parameter")
         
         # Use the reason for logging instead of explanation
-        reason = last_action.get("reason", "No reason provided")
+        reason = last_action.reason
         logger.info(f"GrepSearchAction: {reason}")
         
         # Ensure paths are relative to working directory
@@ -322,6 +490,8 @@ class GrepSearchAction(Node):
         # Use current directory if not specified
         working_dir = params.pop("working_dir", "")
         
+        from utils.search_ops import grep_search
+
         # Call grep_search utility which returns (success, matches)
         return grep_search(
             query=params["query"],
@@ -335,9 +505,9 @@ class GrepSearchAction(Node):
         matches, success = exec_res
         
         # Update the result in the last history entry
-        history = shared.get("history", [])
+        history = shared.get("history")
         if history:
-            history[-1]["result"] = {
+            history[-1].result = {
                 "success": success,
                 "matches": matches
             }
@@ -348,24 +518,21 @@ class GrepSearchAction(Node):
 class ListDirAction(Node):
     def prep(self, shared: Dict[str, Any]) -> str:
         # Get parameters from the last history entry
-        history = shared.get("history", [])
-        if not history:
-            raise ValueError("No history found")
-        
-        last_action = history[-1]
-        path = last_action["params"].get("relative_workspace_path", ".")
+        last_action = _current_action(shared)
+        path = last_action.params.get("relative_workspace_path", ".")
         
         # Use the reason for logging instead of explanation
-        reason = last_action.get("reason", "No reason provided")
+        reason = last_action.reason
         logger.info(f"ListDirAction: {reason}")
         
         # Ensure path is relative to working directory
-        working_dir = shared.get("working_dir", "")
-        full_path = os.path.join(working_dir, path) if working_dir else path
+        full_path = _resolve_path(shared, path)
         
         return full_path
     
-    def exec(self, path: str) -> Tuple[bool, str]:        
+    def exec(self, path: str) -> Tuple[bool, str]:
+        from utils.dir_ops import list_dir
+
         # Call list_dir utility which now returns (success, tree_str)
         success, tree_str = list_dir(path)
         
@@ -375,9 +542,9 @@ class ListDirAction(Node):
         success, tree_str = exec_res
         
         # Update the result in the last history entry with the new structure
-        history = shared.get("history", [])
+        history = shared.get("history")
         if history:
-            history[-1]["result"] = {
+            history[-1].result = {
                 "success": success,
                 "tree_visualization": tree_str
             }
@@ -388,27 +555,24 @@ class ListDirAction(Node):
 class DeleteFileAction(Node):
     def prep(self, shared: Dict[str, Any]) -> str:
         # Get parameters from the last history entry
-        history = shared.get("history", [])
-        if not history:
-            raise ValueError("No history found")
-        
-        last_action = history[-1]
-        file_path = last_action["params"].get("target_file")
+        last_action = _current_action(shared)
+        file_path = last_action.params.get("target_file")
         
         if not file_path:
             raise ValueError("Missing target_file parameter")
         
         # Use the reason for logging instead of explanation
-        reason = last_action.get("reason", "No reason provided")
+        reason = last_action.reason
         logger.info(f"DeleteFileAction: {reason}")
         
         # Ensure path is relative to working directory
-        working_dir = shared.get("working_dir", "")
-        full_path = os.path.join(working_dir, file_path) if working_dir else file_path
+        full_path = _resolve_path(shared, file_path)
         
         return full_path
     
     def exec(self, file_path: str) -> Tuple[bool, str]:
+        from utils.delete_file import delete_file
+
         # Call delete_file utility which returns (success, message)
         return delete_file(file_path)
     
@@ -416,9 +580,9 @@ class DeleteFileAction(Node):
         success, message = exec_res
 
         # Update the result in the last history entry
-        history = shared.get("history", [])
+        history = shared.get("history")
         if history:
-            history[-1]["result"] = {
+            history[-1].result = {
                 "success": success,
                 "message": message
             }
@@ -429,13 +593,9 @@ class DeleteFileAction(Node):
 class RunCommandAction(Node):
     def prep(self, shared: Dict[str, Any]) -> Dict[str, Any]:
         # Get parameters from the last history entry
-        history = shared.get("history", [])
-        if not history:
-            raise ValueError("No history found")
-        
-        last_action = history[-1]
-        command = last_action["params"].get("command")
-        reason = last_action["params"].get("reason", last_action.get("reason", ""))
+        last_action = _current_action(shared)
+        command = last_action.params.get("command")
+        reason = last_action.params.get("reason", last_action.reason)
         
         if not command:
             raise ValueError("Missing command parameter")
@@ -454,6 +614,8 @@ class RunCommandAction(Node):
         }
     
     def exec(self, params: Dict[str, Any]) -> Tuple[bool, str]:
+        from utils.run_command import run_command, get_user_approval, get_streamlit_approval
+
         command = params["command"]
         reason = params["reason"]
         working_dir = params["working_dir"]
@@ -489,7 +651,7 @@ class RunCommandAction(Node):
         success, output = exec_res
         
         # Update the result in the last history entry
-        history = shared.get("history", [])
+        history = shared.get("history")
         if history:
             # Check if command was modified
             modification_info = shared.get("command_modification")
@@ -500,7 +662,7 @@ class RunCommandAction(Node):
                 executed_command = prep_res["command"]
                 original_command = None
             
-            history[-1]["result"] = {
+            history[-1].result = {
                 "success": success,
                 "output": output,
                 "command": executed_command,
@@ -525,23 +687,20 @@ class RunCommandAction(Node):
 class ReadTargetFileNode(Node):
     def prep(self, shared: Dict[str, Any]) -> str:
         # Get parameters from the last history entry
-        history = shared.get("history", [])
-        if not history:
-            raise ValueError("No history found")
-        
-        last_action = history[-1]
-        file_path = last_action["params"].get("target_file")
+        last_action = _current_action(shared)
+        file_path = last_action.params.get("target_file")
         
         if not file_path:
             raise ValueError("Missing target_file parameter")
         
         # Ensure path is relative to working directory
-        working_dir = shared.get("working_dir", "")
-        full_path = os.path.join(working_dir, file_path) if working_dir else file_path
+        full_path = _resolve_path(shared, file_path)
         
         return full_path
     
     def exec(self, file_path: str) -> Tuple[str, bool]:
+        from utils.read_file import read_file
+
         # Call read_file utility which returns (content, success)
         return read_file(file_path)
     
@@ -550,24 +709,20 @@ class ReadTargetFileNode(Node):
         logger.info("ReadTargetFileNode: File read completed for editing")
         
         # Store file content in the history entry
-        history = shared.get("history", [])
+        history = shared.get("history")
         if history:
-            history[-1]["file_content"] = content
+            history[-1].file_content = content
         
 #############################################
 # Analyze and Plan Changes Node
 #############################################
 class AnalyzeAndPlanNode(Node):
     def prep(self, shared: Dict[str, Any]) -> Dict[str, Any]:
-        # Get history
-        history = shared.get("history", [])
-        if not history:
-            raise ValueError("No history found")
-        
-        last_action = history[-1]
-        file_content = last_action.get("file_content")
-        instructions = last_action["params"].get("instructions")
-        code_edit = last_action["params"].get("code_edit")
+        # Get the action being edited from history
+        last_action = _current_action(shared)
+        file_content = last_action.file_content
+        instructions = last_action.params.get("instructions")
+        code_edit = last_action.params.get("code_edit")
         
         if not file_content:
             raise ValueError("File content not found")
@@ -587,9 +742,9 @@ class AnalyzeAndPlanNode(Node):
         instructions = params["instructions"]
         code_edit = params["code_edit"]
         
-        # File content as lines
-        file_lines = file_content.split('\n')
-        total_lines = len(file_lines)
+        # Only the line count is needed here; count('\n') is a C-level scan
+        # with no per-line string allocations (equivalent to len(split('\n')))
+        total_lines = file_content.count('\n') + 1
         
         # Generate a prompt for the LLM to analyze the edit using JSON format
         prompt = f"""
@@ -645,24 +800,26 @@ If the instruction indicates content should be appended to the file, set both st
 to the maximum line number + 1, which will add the content at the end of the file.
 """
         
-        # Call LLM to analyze
-        response = call_llm(prompt, caller="AnalyzeAndPlanNode.exec")
+        # Call LLM to analyze (content-hash cached for deterministic re-runs)
+        response = cached_call_llm(prompt, caller="AnalyzeAndPlanNode.exec")
 
-        # Look for JSON structure in the response
+        # Look for JSON structure with a find-based scan: no list or match
+        # allocations over potentially large responses, one substring copy
         json_content = ""
-        if "```json" in response:
-            json_blocks = response.split("```json")
-            if len(json_blocks) > 1:
-                json_content = json_blocks[1].split("```")[0].strip()
-        elif "```" in response:
+        i = response.find("```json")
+        if i >= 0:
+            j = response.find("```", i + 7)
+            json_content = (response[i + 7:j] if j >= 0 else response[i + 7:]).strip()
+        else:
             # Try to extract from generic code block
-            json_blocks = response.split("```")
-            if len(json_blocks) > 1:
-                json_content = json_blocks[1].strip()
+            i = response.find("```")
+            if i >= 0:
+                j = response.find("```", i + 3)
+                json_content = (response[i + 3:j] if j >= 0 else response[i + 3:]).strip()
         
         if json_content:
-            decision = json.loads(json_content)
-            
+            decision = _json_loads(json_content)
+
             # Validate the required fields
             assert "reasoning" in decision, "Reasoning is missing"
             assert "operations" in decision, "Operations are missing"
@@ -670,16 +827,10 @@ to the maximum line number + 1, which will add the content at the end of the fil
             # Ensure operations is a list
             if not isinstance(decision["operations"], list):
                 raise ValueError("Operations are not a list")
-            
-            # Validate operations
-            for op in decision["operations"]:
-                assert "start_line" in op, "start_line is missing"
-                assert "end_line" in op, "end_line is missing"
-                assert "replacement" in op, "replacement is missing"
-                assert 1 <= op["start_line"] <= total_lines, f"start_line out of range: {op['start_line']}"
-                assert 1 <= op["end_line"] <= total_lines, f"end_line out of range: {op['end_line']}"
-                assert op["start_line"] <= op["end_line"], f"start_line > end_line: {op['start_line']} > {op['end_line']}"
-            
+
+            # Validate operations in one batched pass
+            _validate_operations(decision["operations"], total_lines)
+
             return decision
         else:
             raise ValueError("No JSON object found in response")
@@ -694,6 +845,20 @@ to the maximum line number + 1, which will add the content at the end of the fil
 #############################################
 # Apply Changes Batch Node
 #############################################
+def _flush_lines(path: str, file_lines: List[str], trailing_newline: bool) -> None:
+    """
+    Flush an edited line buffer to disk in one write.
+
+    All operations splice a shared in-memory buffer, so the whole batch costs
+    a single open/write/close regardless of how many edits were applied.
+    """
+    data = '\n'.join(file_lines)
+    if trailing_newline:
+        data += '\n'
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(data)
+
+
 class ApplyChangesNode(BatchNode):
     def prep(self, shared: Dict[str, Any]) -> List[Dict[str, Any]]:
         # Get edit operations
@@ -702,54 +867,139 @@ class ApplyChangesNode(BatchNode):
             logger.warning("No edit operations found")
             return []
         
-        # Sort edit operations in descending order by start_line
-        # This ensures that line numbers remain valid as we edit from bottom to top
-        sorted_ops = sorted(edit_operations, key=lambda op: op["start_line"], reverse=True)
-        
+        # Sort edit operations in descending order by start_line.
+        # Invariant: applying splices bottom-to-top means no operation ever
+        # shifts the line numbers of one still to come, so every op can use
+        # the plan's original 1-based coordinates without any re-mapping pass.
+        # sorted() is stable, so ops on the same start_line keep plan order.
+        sorted_ops = sorted(edit_operations, key=itemgetter("start_line"), reverse=True)
+
         # Get target file from history
-        history = shared.get("history", [])
-        if not history:
-            raise ValueError("No history found")
-        
-        last_action = history[-1]
-        target_file = last_action["params"].get("target_file")
-        
+        last_action = _current_action(shared)
+        target_file = last_action.params.get("target_file")
+
         if not target_file:
             raise ValueError("Missing target_file parameter")
-        
+
         # Ensure path is relative to working directory
-        working_dir = shared.get("working_dir", "")
-        full_path = os.path.join(working_dir, target_file) if working_dir else target_file
-        
-        # Attach file path to each operation
+        full_path = _resolve_path(shared, target_file)
+
+        # Split the file into lines ONCE; every operation splices this shared
+        # list in place and post joins/writes once at the end
+        if os.path.exists(full_path):
+            with open(full_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        else:
+            content = ''
+        file_lines = content.split('\n')
+        # Track the final newline separately so line indices map to content
+        # lines; edits touching the end of file restore it like insert_file did
+        edit_state = {"trailing_newline": content.endswith('\n')}
+        if edit_state["trailing_newline"]:
+            file_lines.pop()
+
+        # Attach file path and the shared line buffer to each operation
         for op in sorted_ops:
             op["target_file"] = full_path
-        
+            op["file_lines"] = file_lines
+            op["edit_state"] = edit_state
+
         return sorted_ops
-    
+
+    def _exec(self, items: List[Dict[str, Any]]) -> List[Tuple[bool, str]]:
+        if not items:
+            return []
+
+        # Operations on the same file splice a shared line buffer and must
+        # stay in bottom-to-top order; only distinct files are independent
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for op in items:
+            groups.setdefault(op["target_file"], []).append(op)
+
+        if len(groups) == 1:
+            return super()._exec(items)
+
+        results: Dict[int, Tuple[bool, str]] = {}
+
+        def _run_group(ops: List[Dict[str, Any]]) -> None:
+            for op in ops:
+                results[id(op)] = Node._exec(self, op)
+
+        with ThreadPoolExecutor(max_workers=min(8, len(groups))) as executor:
+            list(executor.map(_run_group, groups.values()))
+
+        # Preserve the caller's operation order in the results
+        return [results[id(op)] for op in items]
+
     def exec(self, op: Dict[str, Any]) -> Tuple[bool, str]:
-        # Call replace_file utility which returns (success, message)
-        return replace_file(
-            target_file=op["target_file"],
-            start_line=op["start_line"],
-            end_line=op["end_line"],
-            content=op["replacement"]
-        )
-    
+        # Splice the replacement into the shared line buffer; operations are
+        # applied bottom-to-top so earlier line numbers stay valid
+        try:
+            start_line = op["start_line"]
+            end_line = op["end_line"]
+
+            if start_line < 1:
+                return False, "Error: start_line must be at least 1"
+            if end_line < 1:
+                return False, "Error: end_line must be at least 1"
+            if start_line > end_line:
+                return False, "Error: start_line must be less than or equal to end_line"
+
+            # A trailing newline marks line termination, not an extra empty
+            # line (matches the previous replace_file/insert_file behavior)
+            replacement = op["replacement"]
+            if replacement.endswith('\n'):
+                replacement = replacement[:-1]
+
+            file_lines = op["file_lines"]
+            start_idx = start_line - 1
+            if start_idx >= len(file_lines):
+                # Append beyond the end: pad and extend, ending with a newline
+                # just as insert_file used to. On an unterminated file the
+                # first pad merely terminates the last line.
+                pads = start_idx - len(file_lines)
+                if pads and not op["edit_state"]["trailing_newline"]:
+                    pads -= 1
+                file_lines.extend([''] * pads)
+                file_lines.extend(replacement.split('\n'))
+                op["edit_state"]["trailing_newline"] = True
+            else:
+                if end_line >= len(file_lines):
+                    # Edit touches the last line; the rewrite terminates it
+                    op["edit_state"]["trailing_newline"] = True
+                file_lines[start_idx:end_line] = replacement.split('\n')
+            return True, f"Successfully replaced lines {start_line} to {end_line} in {op['target_file']}"
+        except Exception as e:
+            return False, f"Error replacing content: {str(e)}"
+
     def post(self, shared: Dict[str, Any], prep_res: List[Dict[str, Any]], exec_res_list: List[Tuple[bool, str]]) -> str:
-        # Check if all operations were successful
-        all_successful = all(success for success, _ in exec_res_list)
-        
-        # Format results for history
-        result_details = [
-            {"success": success, "message": message} 
-            for success, message in exec_res_list
-        ]
-        
+        # One pass over the results: build the history details and track
+        # overall/any success as we go instead of re-walking the list
+        result_details = []
+        all_successful = True
+        any_successful = False
+        for success, message in exec_res_list:
+            result_details.append({"success": success, "message": message})
+            if success:
+                any_successful = True
+            else:
+                all_successful = False
+
+        # Join once and write the edited buffer back to disk
+        if prep_res and any_successful:
+            target_file = prep_res[0]["target_file"]
+            try:
+                _flush_lines(target_file, prep_res[0]["file_lines"],
+                             prep_res[0]["edit_state"]["trailing_newline"])
+            except Exception as e:
+                logger.error(f"Failed to write edited file {target_file}: {e}")
+                all_successful = False
+
         # Update edit result in history
-        history = shared.get("history", [])
+        history = shared.get("history")
         if history:
-            history[-1]["result"] = {
+            last = history[-1]
+            last.result = {
                 "success": all_successful,
                 "operations": len(exec_res_list),
                 "details": result_details,
@@ -768,18 +1018,14 @@ class ApplyChangesNode(BatchNode):
 class FinishAction(Node):
     def prep(self, shared: Dict[str, Any]) -> str:
         # Get the final_response from the last history entry
-        history = shared.get("history", [])
-        if not history:
-            raise ValueError("No history found")
-        
-        last_action = history[-1]
-        final_response = last_action["params"].get("final_response")
+        last_action = _current_action(shared)
+        final_response = last_action.params.get("final_response")
         
         if not final_response:
             raise ValueError("Missing final_response parameter")
         
         # Use the reason for logging
-        reason = last_action.get("reason", "No reason provided")
+        reason = last_action.reason
         logger.info(f"FinishAction: {reason}")
         
         return final_response
@@ -795,9 +1041,9 @@ class FinishAction(Node):
         shared["response"] = exec_res
         
         # Update the result in the last history entry
-        history = shared.get("history", [])
+        history = shared.get("history")
         if history:
-            history[-1]["result"] = {
+            history[-1].result = {
                 "success": True,
                 "message": "Task completed successfully"
             }
@@ -827,6 +1073,7 @@ def create_main_flow() -> Flow:
     # Create nodes
     main_agent = MainDecisionAgent()
     read_action = ReadFileAction()
+    batch_read_action = BatchReadFilesNode()
     grep_action = GrepSearchAction()
     list_dir_action = ListDirAction()
     delete_action = DeleteFileAction()
@@ -834,26 +1081,37 @@ def create_main_flow() -> Flow:
     edit_agent = create_edit_agent()
     finish_action = FinishAction()
     
-    # Connect main agent to action nodes
-    main_agent - "read_file" >> read_action
-    main_agent - "grep_search" >> grep_action
-    main_agent - "list_dir" >> list_dir_action
-    main_agent - "delete_file" >> delete_action
-    main_agent - "run_command" >> run_command_action
-    main_agent - "edit_file" >> edit_agent
-    main_agent - "finish" >> finish_action
-    
-    # Connect action nodes back to main agent using default action
-    read_action >> main_agent
-    grep_action >> main_agent
-    list_dir_action >> main_agent
-    delete_action >> main_agent
-    run_command_action >> main_agent
-    # run_command_action handles server commands directly with "done" return
-    edit_agent >> main_agent
-    
+    # Build the dispatch table directly: equivalent to wiring each edge with
+    # the `-`/`>>` operator overloads, but populated as one dict per node so
+    # every step's routing is a single hash probe on node.successors
+    main_agent.successors = {
+        "read_file": read_action,
+        "read_files": batch_read_action,
+        "grep_search": grep_action,
+        "list_dir": list_dir_action,
+        "delete_file": delete_action,
+        "run_command": run_command_action,
+        "edit_file": edit_agent,
+        "finish": finish_action,
+    }
+
+    # Action nodes route back to the main agent on the default action
+    # (run_command_action handles server commands directly with "done" return)
+    for action_node in (read_action, batch_read_action, grep_action,
+                        list_dir_action, delete_action, run_command_action,
+                        edit_agent):
+        action_node.successors = {"default": main_agent}
+
+    # The successors dicts above already are the flattened
+    # (node, action) -> next-node table: the runner resolves every step with
+    # one dict probe against the current node, never rewalking the graph, so
+    # no separate memoized transition table is needed.
+
     # Create flow
     return Flow(start=main_agent)
 
-# Create the main flow
-coding_agent_flow = create_main_flow()
\ No newline at end of file
+# Build the main flow lazily: importing this module for a helper no longer
+# pays for instantiating and wiring the whole graph
+@lru_cache(maxsize=1)
+def get_coding_agent_flow() -> Flow:
+    return create_main_flow()
\ No newline at end of file
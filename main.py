@@ -2,7 +2,7 @@ import os
 import argparse
 import logging
 from datetime import datetime
-from flow import coding_agent_flow
+from flow import get_coding_agent_flow
 
 # Set up logging with separate console and file handlers
 logger_root = logging.getLogger()
@@ -102,8 +102,8 @@ def main():
                 "mode": "cli"  # Indicate CLI mode
             }
             
-            # Run the flow
-            coding_agent_flow.run(shared)
+            # Run the flow (built once on first use, then reused)
+            get_coding_agent_flow().run(shared)
             
             # Display the response
             response = shared.get("response", "No response generated.")
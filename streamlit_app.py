@@ -1,12 +1,14 @@
 import streamlit as st
 import os
 import logging
+import logging.handlers
 import threading
 import queue
 import time
 import io
 import json
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List
 from datetime import datetime
 
@@ -59,43 +61,143 @@ Mock processing completed successfully!"""
         time.sleep(0.5)
         logger.info("✅ Response generated successfully")
 
+# One persistent worker reused across queries, so each request submits a task
+# instead of constructing and tearing down a thread. Queries run one at a
+# time, which is also what the approval handshake assumes. cache_resource
+# is what actually makes it persistent: Streamlit re-executes this module
+# on every rerun, so a plain module-level executor would be rebuilt each
+# time and never reused
+@st.cache_resource
+def _get_worker() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent")
+
+# Session-state defaults applied at the top of every script run; mutable
+# defaults are factories so sessions never alias the same list
+_SESSION_DEFAULTS = {
+    "processing": False,
+    "logs": list,
+    "response": None,
+    "error": None,
+    "error_trace": None,
+    "conversation_history": list,
+    "current_query": "",
+    "input_key_counter": 0,
+    "command_approval_counter": 0,
+}
+
+# How many recent exchanges to render by default; older turns stay in memory
+# but out of the element tree so rerun cost stops growing with chat length
+HISTORY_WINDOW = 20
+
+# Languages st.code can highlight from the first-line heuristic
+_CODE_LANGS = frozenset({'python', 'json', 'bash', 'javascript'})
+
+def _parse_markdown(response_text):
+    """Split a response into ("text"|"code", lang, body) segments, once.
+
+    The conversation render loop used to re-split every past response on
+    each rerun; parsing at append time makes redraws a straight dispatch
+    over precomputed segments. Semantics match the old inline parser,
+    including the first-line language heuristic for code blocks.
+    """
+    if "```" not in response_text:
+        return [("text", None, response_text)]
+
+    segments = []
+    parts = response_text.split("```")
+    for j, part in enumerate(parts):
+        if j % 2 == 0:  # Regular text
+            if part.strip():
+                segments.append(("text", None, part.strip()))
+        else:  # Code block
+            lines = part.strip().split('\n')
+            if lines and not lines[0].strip().startswith('{'):
+                # First line might be language
+                lang = lines[0].strip()
+                code = '\n'.join(lines[1:])
+                segments.append(("code", lang if lang in _CODE_LANGS else 'text', code))
+            else:
+                segments.append(("code", None, part.strip()))
+    return segments
+
+@st.cache_data(show_spinner=False)
+def _dir_listing(path: str, mtime_ns: int):
+    """List a directory as (name, is_dir) pairs, cached per (path, mtime).
+
+    The mtime key invalidates the entry whenever the directory changes, so
+    reruns triggered by unrelated widgets skip the filesystem walk entirely.
+    scandir's DirEntry.is_dir reads the file-type bits returned with the
+    directory entry, avoiding the per-item stat that listdir+isdir paid.
+    """
+    with os.scandir(path) as it:
+        return [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in it]
+
 def get_flow():
     """Get the coding agent flow, with fallback to mock"""
     try:
-        from flow import coding_agent_flow
-        return coding_agent_flow
+        from flow import get_coding_agent_flow
+        return get_coding_agent_flow()
     except ImportError:
         st.warning("⚠️ PocketFlow not available - using mock mode for demonstration")
         return MockFlow()
 
 def setup_logging(log_queue):
-    """Setup logging to capture both console and streamlit logs"""
+    """Setup logging to capture both console and streamlit logs.
+
+    The root logger gets only a QueueHandler, so worker threads pay a cheap
+    enqueue per record; formatting and dispatch to the Streamlit sink happen
+    in a QueueListener thread off the hot path. Returns the listener so the
+    caller can stop it when the run finishes.
+    """
     # Clear existing handlers
     logging.getLogger().handlers.clear()
-    
+
     # Create formatter
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    
-    # Create custom handler for Streamlit
+
+    # Create custom handler for Streamlit (a sink behind the listener)
     streamlit_handler = StreamlitLogHandler(log_queue)
     streamlit_handler.setLevel(logging.INFO)
     streamlit_handler.setFormatter(formatter)
-    
-    # Setup root logger
+
+    # Setup root logger: producers only enqueue raw records
+    record_queue = queue.SimpleQueue()
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.INFO)
-    root_logger.addHandler(streamlit_handler)
-    
+    root_logger.addHandler(logging.handlers.QueueHandler(record_queue))
+
+    listener = logging.handlers.QueueListener(
+        record_queue, streamlit_handler, respect_handler_level=True
+    )
+    listener.start()
+
     # Suppress third-party library logs
     logging.getLogger("anthropic").setLevel(logging.WARNING)
     logging.getLogger("httpcore").setLevel(logging.WARNING)
     logging.getLogger("httpx").setLevel(logging.WARNING)
     logging.getLogger("streamlit").setLevel(logging.WARNING)
 
-def run_agent_flow(shared_data, log_queue):
+    return listener
+
+def drain_queue(q, limit=256):
+    """Drain up to limit queued items without raising queue.Empty per poll.
+
+    qsize() bounds the loop, so an idle refresh costs one size check instead
+    of an exception raise/catch; the try/except only covers the rare race
+    where another consumer got there first.
+    """
+    out = []
+    for _ in range(min(q.qsize(), limit)):
+        try:
+            out.append(q.get_nowait())
+        except queue.Empty:
+            break
+    return out
+
+def run_agent_flow(shared_data, log_queue, done_event=None):
     """Run the agent flow in a separate thread"""
+    listener = setup_logging(log_queue)
     try:
-        setup_logging(log_queue)
         flow = get_flow()
         flow.run(shared_data)
     except Exception as e:
@@ -103,6 +205,12 @@ def run_agent_flow(shared_data, log_queue):
         logger.error(f"❌ Error running flow: {str(e)}")
         shared_data["error"] = str(e)
         shared_data["error_trace"] = traceback.format_exc()
+    finally:
+        # Drain and stop the listener so the last records reach the UI queue
+        listener.stop()
+        # Wake the polling UI immediately instead of waiting out its timeout
+        if done_event is not None:
+            done_event.set()
 
 def main():
     st.set_page_config(
@@ -131,12 +239,12 @@ def main():
         if working_dir and os.path.exists(working_dir):
             st.success(f"✅ Directory exists")
             
-            # Show directory contents
+            # Show directory contents (cached until the directory's mtime changes)
             try:
-                contents = os.listdir(working_dir)
+                contents = _dir_listing(working_dir, os.stat(working_dir).st_mtime_ns)
                 st.write(f"📋 **Contents ({len(contents)} items):**")
-                for item in contents[:10]:  # Show first 10 items
-                    if os.path.isdir(os.path.join(working_dir, item)):
+                for item, is_dir in contents[:10]:  # Show first 10 items
+                    if is_dir:
                         st.write(f"📁 {item}")
                     else:
                         st.write(f"📄 {item}")
@@ -160,6 +268,7 @@ def main():
             st.session_state.error = None
             st.session_state.error_trace = None
             st.session_state.processing = False
+            st.session_state.show_all_history = False
             st.session_state.input_key_counter += 1  # Force new input widget
             st.rerun()
         
@@ -183,32 +292,24 @@ def main():
                     mime="application/json"
                 )
     
-    # Initialize session state
-    if 'processing' not in st.session_state:
-        st.session_state.processing = False
-    if 'logs' not in st.session_state:
-        st.session_state.logs = []
-    if 'response' not in st.session_state:
-        st.session_state.response = None
-    if 'error' not in st.session_state:
-        st.session_state.error = None
-    if 'error_trace' not in st.session_state:
-        st.session_state.error_trace = None
-    if 'conversation_history' not in st.session_state:
-        st.session_state.conversation_history = []
-    if 'current_query' not in st.session_state:
-        st.session_state.current_query = ""
-    if 'input_key_counter' not in st.session_state:
-        st.session_state.input_key_counter = 0
-    if 'command_approval_counter' not in st.session_state:
-        st.session_state.command_approval_counter = 0
+    # Initialize session state from the shared defaults table
+    for key, default in _SESSION_DEFAULTS.items():
+        if key not in st.session_state:
+            st.session_state[key] = default() if callable(default) else default
     
     # Main chat interface
     st.header("💬 Conversation")
     
-    # Display conversation history
+    # Display conversation history (windowed: only the most recent turns are
+    # rendered unless the user asks for the rest)
     if st.session_state.conversation_history:
-        for i, exchange in enumerate(st.session_state.conversation_history):
+        history = st.session_state.conversation_history
+        start = 0 if st.session_state.get("show_all_history") else max(0, len(history) - HISTORY_WINDOW)
+        if start > 0:
+            if st.button(f"⏫ Load earlier messages ({start} hidden)"):
+                st.session_state.show_all_history = True
+                st.rerun()
+        for i, exchange in enumerate(history[start:], start=start):
             # User message
             with st.container():
                 st.markdown(f"**🙋 You:** {exchange['user_query']}")
@@ -216,27 +317,20 @@ def main():
                 # AI response  
                 with st.container():
                     st.markdown(f"**🤖 Assistant:**")
-                    # Parse and display response nicely
-                    response_text = exchange['response']
-                    
-                    if "```" in response_text:
-                        parts = response_text.split("```")
-                        for j, part in enumerate(parts):
-                            if j % 2 == 0:  # Regular text
-                                if part.strip():
-                                    st.markdown(part.strip())
-                            else:  # Code block
-                                # Try to detect language
-                                lines = part.strip().split('\n')
-                                if lines and not lines[0].strip().startswith('{'):
-                                    # First line might be language
-                                    lang = lines[0].strip()
-                                    code = '\n'.join(lines[1:])
-                                    st.code(code, language=lang if lang in ['python', 'json', 'bash', 'javascript'] else 'text')
-                                else:
-                                    st.code(part.strip())
-                    else:
-                        st.markdown(response_text)
+                    # Display the pre-parsed segments (parse lazily for
+                    # exchanges imported from before parsing existed)
+                    parsed = exchange.get("parsed")
+                    if parsed is None:
+                        parsed = _parse_markdown(exchange['response'])
+                        exchange["parsed"] = parsed
+
+                    for kind, lang, body in parsed:
+                        if kind == "text":
+                            st.markdown(body)
+                        elif lang:
+                            st.code(body, language=lang)
+                        else:
+                            st.code(body)
                 
                 # Metadata
                 col1, col2 = st.columns([3, 1])
@@ -307,8 +401,8 @@ def main():
     
     # Show processing interface if currently processing
     if st.session_state.processing:
-        # Initialize shared data and thread if not exists
-        if 'processing_thread' not in st.session_state:
+        # Initialize shared data and worker task if not exists
+        if 'processing_future' not in st.session_state:
             # Create shared data for the current processing
             st.session_state.shared_data = {
                 "user_query": st.session_state.current_query,
@@ -320,20 +414,23 @@ def main():
                 "mode": "streamlit"  # Indicate Streamlit mode
             }
             
-            # Create log queue and start processing  
-            st.session_state.log_queue = queue.Queue()
-            
-            # Start agent in separate thread
-            st.session_state.processing_thread = threading.Thread(
-                target=run_agent_flow,
-                args=(st.session_state.shared_data, st.session_state.log_queue),
-                daemon=True
+            # Create log queue and start processing. SimpleQueue skips the
+            # lock/Condition bookkeeping of queue.Queue - this is a plain
+            # single-producer/single-consumer pipe with no task tracking.
+            st.session_state.log_queue = queue.SimpleQueue()
+            st.session_state.done_event = threading.Event()
+
+            # Submit the query to the persistent worker
+            st.session_state.processing_future = _get_worker().submit(
+                run_agent_flow,
+                st.session_state.shared_data,
+                st.session_state.log_queue,
+                st.session_state.done_event,
             )
-            st.session_state.processing_thread.start()
             st.session_state.processing_start_time = time.time()
-        
-        # Get current thread and data
-        agent_thread = st.session_state.processing_thread
+
+        # Get current task and data
+        agent_future = st.session_state.processing_future
         shared_data = st.session_state.shared_data
         log_queue = st.session_state.log_queue
         
@@ -432,14 +529,9 @@ def main():
                 st.info("❌ Command rejected - continuing with alternative approach...")
         
         # Process new log entries (only if no pending command)
-        new_logs = []
-        try:
-            while True:
-                log_entry = log_queue.get_nowait()
-                new_logs.append(log_entry)
-                st.session_state.logs.append(log_entry)
-        except queue.Empty:
-            pass
+        new_logs = drain_queue(log_queue)
+        if new_logs:
+            st.session_state.logs.extend(new_logs)
         
         # Show processing logs
         with st.expander("📝 Processing Logs", expanded=True):
@@ -450,10 +542,11 @@ def main():
                 st.code(log_text, language="text")
             
             # Show status
-            if agent_thread.is_alive():
+            if not agent_future.done():
                 st.info(f"🔄 Processing... ({len(st.session_state.logs)} log entries)")
-                # Auto-refresh every 2 seconds instead of 0.5 seconds
-                time.sleep(2)
+                # Refresh logs every 0.5s, but wake immediately when the
+                # worker signals completion instead of sleeping it out
+                st.session_state.done_event.wait(timeout=0.5)
                 st.rerun()
             else:
                 # Show success or error depending on worker result
@@ -463,12 +556,12 @@ def main():
                     st.success(f"✅ Processing complete!")
         
         # Show error details outside the logs expander to avoid nesting
-        if not agent_thread.is_alive() and shared_data.get("error_trace"):
+        if agent_future.done() and shared_data.get("error_trace"):
             with st.expander("View error details", expanded=False):
                 st.code(shared_data.get("error_trace"), language="text")
         
         # Process completion when thread is done
-        if not agent_thread.is_alive():
+        if agent_future.done():
             # Get final response
             final_response = shared_data.get("response")
             st.session_state.response = final_response
@@ -477,9 +570,10 @@ def main():
             st.session_state.processing = False
             
             # Clean up processing state
-            del st.session_state.processing_thread
+            del st.session_state.processing_future
             del st.session_state.shared_data
             del st.session_state.log_queue
+            del st.session_state.done_event
             del st.session_state.processing_start_time
             
             # Add to conversation history if we got a response
@@ -487,6 +581,7 @@ def main():
                 st.session_state.conversation_history.append({
                     "user_query": st.session_state.current_query,
                     "response": final_response,
+                    "parsed": _parse_markdown(final_response),
                     "timestamp": datetime.now().isoformat(),
                     "actions_taken": len(shared_data.get("history", []))
                 })
@@ -1,55 +1,320 @@
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
+import atexit
 import os
 import logging
+import logging.handlers
 import json
+import queue
+import sqlite3
+import threading
+from hashlib import blake2b
+from utils import semantic_cache
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Model used for every request; also imported by the response caches as
+# their key salt, so bumping it here invalidates cached responses too
+MODEL = "claude-sonnet-4-20250514"
+
 # Global logger variable and initialization flag
 logger = None
 _logger_initialized = False
+_log_listener = None
 
 def _ensure_logger_initialized():
     """Initialize logger only when first needed (lazy initialization)."""
-    global logger, _logger_initialized
-    
+    global logger, _logger_initialized, _log_listener
+
     if _logger_initialized:
         return
-    
+
     # Configure logging directory
     log_directory = os.getenv("LOG_DIR", "logs")
     os.makedirs(log_directory, exist_ok=True)
-    
+
     # Use per-run timestamped file (to seconds) - only when actually needed
     log_file = os.path.join(log_directory, f"llm_calls_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
-    
+
     # Set up logger
     logger = logging.getLogger("llm_logger")
     logger.setLevel(logging.DEBUG)  # Allow all levels
     logger.propagate = False  # Prevent propagation to root logger to avoid duplicates
-    
+
     # Only add handlers if they don't already exist
     if not logger.handlers:
         # Console handler - show INFO and above
         console_handler = logging.StreamHandler()
         console_handler.setLevel(logging.INFO)
         console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-        logger.addHandler(console_handler)
-        
+
         # File handler - save DEBUG and above
         file_handler = logging.FileHandler(log_file)
         file_handler.setLevel(logging.DEBUG)
         file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-        logger.addHandler(file_handler)
-    
+
+        # Callers only enqueue records (responses can be tens of KB); the
+        # listener thread formats and writes them so disk IO never blocks
+        # or serializes concurrent LLM calls
+        log_queue = queue.SimpleQueue()
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        _log_listener = logging.handlers.QueueListener(
+            log_queue, console_handler, file_handler, respect_handler_level=True
+        )
+        _log_listener.start()
+        atexit.register(_log_listener.stop)
+
     _logger_initialized = True
 
-# Simple cache configuration
-cache_file = "llm_cache.json"
+# Simple cache configuration: SQLite key-value store so hits and inserts are
+# index seeks instead of a full-file JSON load/rewrite per call
+cache_file = "llm_cache.db"
+_legacy_cache_file = "llm_cache.json"
+
+_cache_db = None
+_cache_db_lock = threading.Lock()
+
+
+def _prompt_key(prompt: str) -> str:
+    """Fixed-size cache key: hashing once per call keeps dict lookups and the
+    on-disk index at 32 bytes instead of re-hashing megabyte prompts."""
+    return blake2b(prompt.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _get_cache_db() -> sqlite3.Connection:
+    """Open the cache database once, creating the table on first use."""
+    global _cache_db
+
+    if _cache_db is None:
+        with _cache_db_lock:
+            if _cache_db is None:
+                db = sqlite3.connect(cache_file, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                # prompt_prefix keeps the first 200 chars purely for debugging
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS cache "
+                    "(key TEXT PRIMARY KEY, prompt_prefix TEXT, response TEXT)"
+                )
+                _migrate_full_prompt_keys(db)
+                _migrate_legacy_cache(db)
+                _cache_db = db
+
+    return _cache_db
+
+
+def _migrate_full_prompt_keys(db: sqlite3.Connection) -> None:
+    """Rekey a database from the era when full prompts were primary keys."""
+    cols = [row[1] for row in db.execute("PRAGMA table_info(cache)")]
+    if cols != ["prompt", "response"]:
+        return
+    try:
+        db.execute("ALTER TABLE cache RENAME TO cache_v1")
+        db.execute(
+            "CREATE TABLE cache (key TEXT PRIMARY KEY, prompt_prefix TEXT, response TEXT)"
+        )
+        old_rows = db.execute("SELECT prompt, response FROM cache_v1").fetchall()
+        db.executemany(
+            "INSERT OR REPLACE INTO cache (key, prompt_prefix, response) VALUES (?, ?, ?)",
+            [(_prompt_key(prompt), prompt[:200], response) for prompt, response in old_rows]
+        )
+        db.execute("DROP TABLE cache_v1")
+        db.commit()
+    except Exception:
+        # Migration is best-effort; worst case the old rows become misses
+        pass
+
+
+# In-memory view of the cache, keyed by _prompt_key: loaded from SQLite once
+# per process, hits are then plain dict lookups with no disk IO at all
+_mem_cache: Optional[Dict[str, str]] = None
+
+# New entries go to the in-memory dict immediately and are persisted by a
+# background writer that batches inserts (up to _WRITE_BATCH rows or
+# _WRITE_LINGER seconds per commit). With WAL journaling each commit is a
+# sequential append to the write-ahead log, so per-miss IO stays O(1) in
+# cache size - the append-only write pattern without a JSONL side file or
+# the compaction job it would need.
+_write_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+_writer_started = False
+_WRITE_BATCH = 32
+_WRITE_LINGER = 2.0
+
+
+def _load_mem_cache() -> Dict[str, str]:
+    """Load the whole cache table into a dict, once."""
+    global _mem_cache
+
+    if _mem_cache is None:
+        db = _get_cache_db()
+        with _cache_db_lock:
+            if _mem_cache is None:
+                rows = db.execute("SELECT key, response FROM cache").fetchall()
+                _mem_cache = dict(rows)
+
+    return _mem_cache
+
+
+def _persist_batch(batch) -> None:
+    db = _get_cache_db()
+    with _cache_db_lock:
+        db.executemany(
+            "INSERT OR REPLACE INTO cache (key, prompt_prefix, response) VALUES (?, ?, ?)",
+            batch
+        )
+        db.commit()
+
+
+def _writer_loop() -> None:
+    """Drain queued cache entries into SQLite in batches."""
+    while True:
+        batch = [_write_queue.get()]
+        try:
+            while len(batch) < _WRITE_BATCH:
+                batch.append(_write_queue.get(timeout=_WRITE_LINGER))
+        except queue.Empty:
+            pass
+        try:
+            _persist_batch(batch)
+        except Exception:
+            # Persistence is best-effort; the in-memory entry still serves hits
+            pass
+
+
+def _flush_writes() -> None:
+    """Synchronously persist anything still queued (registered atexit)."""
+    batch = []
+    try:
+        while True:
+            batch.append(_write_queue.get_nowait())
+    except queue.Empty:
+        pass
+    if batch:
+        try:
+            _persist_batch(batch)
+        except Exception:
+            pass
+
+
+def _enqueue_write(key: str, prompt: str, response_text: str) -> None:
+    """Hand a new cache entry to the background writer, starting it lazily."""
+    global _writer_started
+
+    if not _writer_started:
+        with _cache_db_lock:
+            if not _writer_started:
+                threading.Thread(target=_writer_loop, daemon=True).start()
+                atexit.register(_flush_writes)
+                _writer_started = True
+
+    _write_queue.put((key, prompt[:200], response_text))
+
+
+def _migrate_legacy_cache(db: sqlite3.Connection) -> None:
+    """One-time import of the old llm_cache.json into the database."""
+    if not os.path.exists(_legacy_cache_file):
+        return
+    try:
+        with open(_legacy_cache_file, 'r') as f:
+            legacy = json.load(f)
+        db.executemany(
+            "INSERT OR REPLACE INTO cache (key, prompt_prefix, response) VALUES (?, ?, ?)",
+            [(_prompt_key(prompt), prompt[:200], response) for prompt, response in legacy.items()]
+        )
+        db.commit()
+        os.remove(_legacy_cache_file)
+    except Exception:
+        # Migration is best-effort; a corrupt legacy file just gets ignored
+        pass
+
+# Shared API clients: one httpx connection pool per process, so non-cached
+# calls reuse warm TCP/TLS connections instead of handshaking every time
+_client = None
+_async_client = None
+
+
+def _get_client() -> Anthropic:
+    global _client
+    if _client is None:
+        _client = Anthropic(api_key=os.getenv("CLAUDE_API_KEY"), max_retries=2, timeout=60.0)
+    return _client
+
+
+def _get_async_client() -> AsyncAnthropic:
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncAnthropic(api_key=os.getenv("CLAUDE_API_KEY"), max_retries=2, timeout=60.0)
+    return _async_client
+
+
+def _cache_lookup(prompt: str, caller_tag: str) -> Optional[str]:
+    """Return the cached response for a prompt, or None on a miss."""
+    try:
+        cache = _load_mem_cache()
+    except sqlite3.Error:
+        logger.warning(f"Failed to read cache, treating as miss")
+        return None
+
+    cached = cache.get(_prompt_key(prompt))
+    if cached is not None:
+        logger.debug("Cache hit for prompt: %.50s...", prompt)
+        return cached
+
+    # Fall back to the fuzzy layer so rephrasings can still hit
+    return semantic_cache.lookup(prompt)
+
+
+def _cache_store(prompt: str, response_text: str, caller_tag: str) -> None:
+    """Record a response: the dict serves hits right away and the background
+    writer persists the entry without blocking the call."""
+    try:
+        key = _prompt_key(prompt)
+        _load_mem_cache()[key] = response_text
+        _enqueue_write(key, prompt, response_text)
+        semantic_cache.store(prompt, response_text)
+        logger.info("Added to cache [%s]", caller_tag)
+    except Exception as e:
+        logger.error(f"Failed to save cache: {e}")
+
+
+def _build_message_params(prompt: str, use_thinking: bool, cache_prefix: Optional[str] = None) -> dict:
+    if cache_prefix:
+        # Mark the stable prefix for server-side prompt caching so the API
+        # reuses its KV cache instead of re-running prefill on every turn
+        content = [
+            {"type": "text", "text": cache_prefix, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": prompt},
+        ]
+    else:
+        content = prompt
+
+    message_params = {
+        "max_tokens": 20000,
+        "messages": [{"role": "user", "content": content}],
+        "model": MODEL
+    }
+
+    if cache_prefix:
+        message_params["extra_headers"] = {"anthropic-beta": "prompt-caching-2024-07-31"}
+
+    # Add thinking if enabled
+    if use_thinking:
+        message_params["thinking"] = {
+            "type": "enabled",
+            "budget_tokens": 16000
+        }
+
+    return message_params
+
+
+def _extract_response_text(response, use_thinking: bool) -> str:
+    # With thinking the text block follows the thinking block at index 1;
+    # without it the response text is at index 0
+    return response.content[1].text if use_thinking else response.content[0].text
+
 
 # Learn more about calling the LLM: https://the-pocket.github.io/PocketFlow/utility_function/llm.html
 def call_llm(
@@ -57,89 +322,110 @@ def call_llm(
     use_cache: bool = True,
     use_thinking: bool = False,
     caller: Optional[str] = None,
+    cache_prefix: Optional[str] = None,
 ) -> str:
-    """Call the LLM and log prompt/response with optional caller context."""
+    """Call the LLM and log prompt/response with optional caller context.
+
+    cache_prefix, when given, is a byte-stable leading block (e.g. the tool
+    catalog) sent with cache_control so the API reuses its prefill KV cache;
+    the local cache still keys on the full prefix+prompt text.
+    """
     # Ensure logger is initialized before use
     _ensure_logger_initialized()
-    
+
     caller_tag = caller or "unknown"
+    full_prompt = (cache_prefix + prompt) if cache_prefix else prompt
     # Log the prompt with caller context
-    logger.debug(f"PROMPT [{caller_tag}]: {prompt}")
-    
-    # Check cache if enabled
+    logger.debug("PROMPT [%s]: %s", caller_tag, full_prompt)
+
+    # Check cache if enabled: hits are served from the in-memory dict
     if use_cache:
-        # Load cache from disk
-        cache = {}
-        if os.path.exists(cache_file):
-            try:
-                with open(cache_file, 'r') as f:
-                    cache = json.load(f)
-            except:
-                logger.warning(f"Failed to load cache, starting with empty cache")
-        
-        # Return from cache if exists
-        if prompt in cache:
-            logger.debug(f"Cache hit [{caller_tag}] for prompt: {prompt[:50]}...")
-            return cache[prompt]
-    
-    # Call the LLM if not in cache or cache disabled
-    client = Anthropic(
-        api_key=os.getenv("CLAUDE_API_KEY")
-    )
-    # Prepare message parameters
-    message_params = {
-        "max_tokens": 20000,
-        "messages": [{"role": "user", "content": prompt}],
-        "model": "claude-sonnet-4-20250514"
-    }
-    
-    # Add thinking if enabled
-    if use_thinking:
-        message_params["thinking"] = {
-            "type": "enabled",
-            "budget_tokens": 16000
-        }
-    
-    response = client.messages.create(**message_params)
-    
-    # Extract response text based on whether thinking is enabled
+        cached = _cache_lookup(full_prompt, caller_tag)
+        if cached is not None:
+            return cached
+
+    # Call the LLM if not in cache or cache disabled. Without thinking the
+    # response is streamed: tokens are consumed as they arrive instead of
+    # blocking until the full message exists. Chunks are not logged — the
+    # file handler is DEBUG-level, so a per-fragment line would write
+    # hundreds of log records per call for text the RESPONSE line below
+    # already captures in full.
+    message_params = _build_message_params(prompt, use_thinking, cache_prefix)
     if use_thinking:
-        response_text = response.content[1].text  # With thinking, response is at index 1
+        response = _get_client().messages.create(**message_params)
+        response_text = _extract_response_text(response, use_thinking)
     else:
-        response_text = response.content[0].text  # Without thinking, response is at index 0
-    
+        chunks = []
+        with _get_client().messages.stream(**message_params) as stream:
+            for text in stream.text_stream:
+                chunks.append(text)
+        response_text = "".join(chunks)
+
     # Log the response
-    logger.info(f"RESPONSE [{caller_tag}]: {response_text}")
-    
+    logger.info("RESPONSE [%s]: %s", caller_tag, response_text)
+
     # Update cache if enabled
     if use_cache:
-        # Load cache again to avoid overwrites
-        cache = {}
-        if os.path.exists(cache_file):
-            try:
-                with open(cache_file, 'r') as f:
-                    cache = json.load(f)
-            except:
-                pass
-        
-        # Add to cache and save
-        cache[prompt] = response_text
-        try:
-            with open(cache_file, 'w') as f:
-                json.dump(cache, f)
-            logger.info(f"Added to cache [{caller_tag}]")
-        except Exception as e:
-            logger.error(f"Failed to save cache: {e}")
-    
+        _cache_store(full_prompt, response_text, caller_tag)
+
+    return response_text
+
+
+async def call_llm_async(
+    prompt: str,
+    use_cache: bool = True,
+    use_thinking: bool = False,
+    caller: Optional[str] = None,
+    cache_prefix: Optional[str] = None,
+) -> str:
+    """Async variant of call_llm: awaiting the network call lets one event
+    loop multiplex many concurrent LLM requests instead of one thread each."""
+    # Ensure logger is initialized before use
+    _ensure_logger_initialized()
+
+    caller_tag = caller or "unknown"
+    full_prompt = (cache_prefix + prompt) if cache_prefix else prompt
+    # Log the prompt with caller context
+    logger.debug("PROMPT [%s]: %s", caller_tag, full_prompt)
+
+    # Check cache if enabled: hits are served from the in-memory dict
+    if use_cache:
+        cached = _cache_lookup(full_prompt, caller_tag)
+        if cached is not None:
+            return cached
+
+    # Call the LLM if not in cache or cache disabled
+    response = await _get_async_client().messages.create(**_build_message_params(prompt, use_thinking, cache_prefix))
+    response_text = _extract_response_text(response, use_thinking)
+
+    # Log the response
+    logger.info("RESPONSE [%s]: %s", caller_tag, response_text)
+
+    # Update cache if enabled
+    if use_cache:
+        _cache_store(full_prompt, response_text, caller_tag)
+
     return response_text
 
 def clear_cache() -> None:
-    """Clear the cache file if it exists."""
+    """Clear all cached responses."""
     # Ensure logger is initialized before use
     _ensure_logger_initialized()
-    
-    if os.path.exists(cache_file):
-        os.remove(cache_file)
+
+    if _cache_db is not None or os.path.exists(cache_file):
+        # Drop anything still waiting on the background writer first
+        try:
+            while True:
+                _write_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        db = _get_cache_db()
+        with _cache_db_lock:
+            db.execute("DELETE FROM cache")
+            db.commit()
+            if _mem_cache is not None:
+                _mem_cache.clear()
         logger.info("Cache cleared")
 
 if __name__ == "__main__":
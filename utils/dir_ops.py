@@ -1,17 +1,35 @@
 import os
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Tuple
 
 # Default maximum characters to return in the tree visualization
 DEFAULT_MAX_OUTPUT_CHARS = 4000
 
-def _build_tree_str(items: List[Dict[str, Any]], prefix: str = "") -> str:
+# Repeat listings of an unchanged tree are served from this cache: a hit
+# costs one stat call instead of a full walk. Entries expire after the TTL
+# and whenever the directory's own mtime moves (a shallow check — edits
+# deep inside a subdirectory can go unnoticed until the TTL lapses)
+_LIST_DIR_CACHE = {}  # (abspath, max_chars) -> (cached_at, mtime, tree_str)
+_LIST_DIR_TTL = 10.0  # seconds
+
+# Tree-drawing fragments, hoisted so rendering doesn't rebuild these small
+# strings per entry; trailing spaces are part of the fragment
+_CONN_LAST = "└── "
+_CONN_MID = "├── "
+_INDENT_LAST = "    "
+_INDENT_MID = "│   "
+
+def _iter_tree_lines(items: List[Dict[str, Any]], prefix: str = ""):
     """
-    Build a tree-style string representation of the directory structure.
+    Yield tree-style lines for the directory structure, one entry at a
+    time. Generating lazily lets the caller stop at its character cap
+    without formatting the tail of a huge tree.
     - Shows one level of recursion (root + each directory's children)
-    - Lists all files (no fixed count limit); overall output is capped later by char count
+    - Lists all files (no fixed count limit); output is capped by the caller
     """
-    tree_str = ""
-
     # Split items into directories and files
     dirs = [item for item in items if item["type"] == "directory"]
     files = [item for item in items if item["type"] == "file"]
@@ -19,23 +37,25 @@ def _build_tree_str(items: List[Dict[str, Any]], prefix: str = "") -> str:
     # Process directories first, then files
     for i, item in enumerate(dirs):
         is_last_dir = (i == len(dirs) - 1) and (len(files) == 0)
-        connector = "└──" if is_last_dir else "├──"
-        tree_str += f"{prefix}{connector} {item['name']}/\n"
+        connector = _CONN_LAST if is_last_dir else _CONN_MID
+        yield f"{prefix}{connector}{item['name']}/\n"
 
         # Show children (one level deeper only, as provided by the recursive lister)
-        next_prefix = prefix + ("    " if is_last_dir else "│   ")
+        next_prefix = prefix + (_INDENT_LAST if is_last_dir else _INDENT_MID)
         if "children" in item and item["children"]:
             # Recursively render children of this directory
-            tree_str += _build_tree_str(item["children"], next_prefix)
+            yield from _iter_tree_lines(item["children"], next_prefix)
 
-    # Then process files (list all files; truncation handled by outer cap)
+    # Then process files
     for i, item in enumerate(files):
         is_last_file = (i == len(files) - 1)
-        connector = "└──" if is_last_file else "├──"
+        connector = _CONN_LAST if is_last_file else _CONN_MID
         size_str = f" ({item['size'] / 1024:.1f} KB)" if item.get("size", 0) > 0 else ""
-        tree_str += f"{prefix}{connector} {item['name']}{size_str}\n"
+        yield f"{prefix}{connector}{item['name']}{size_str}\n"
 
-    return tree_str
+def _build_tree_str(items: List[Dict[str, Any]], prefix: str = "") -> str:
+    """Render the full tree string (no cap); join beats += concatenation."""
+    return "".join(_iter_tree_lines(items, prefix))
 
 def list_dir(relative_workspace_path: str) -> Tuple[bool, str]:
     """
@@ -47,54 +67,119 @@ def list_dir(relative_workspace_path: str) -> Tuple[bool, str]:
     Returns:
         Tuple of (success status, tree visualization string)
     """
-    def _list_dir_recursive(path: str, depth: int = 0) -> List[Dict[str, Any]]:
+    # The formatted output is capped at max_chars, so scanning far beyond
+    # it is wasted work. The walk budget is charged per entry at the
+    # minimum that entry can render to (connector + name + newline);
+    # real lines are never shorter, so the budget only runs out on
+    # listings the character cap below would have truncated anyway
+    max_chars = int(os.environ.get("LIST_DIR_MAX_CHARS", DEFAULT_MAX_OUTPUT_CHARS))
+    remaining_budget = max_chars
+    budget_lock = threading.Lock()
+
+    def _take_budget(cost: int) -> bool:
+        nonlocal remaining_budget
+        with budget_lock:
+            if remaining_budget <= 0:
+                return False
+            remaining_budget -= cost
+            return True
+
+    def _scan_one_level(path: str) -> List[Dict[str, Any]]:
+        """Scan a single directory without recursing; thread-safe."""
         items = []
+        truncated = False
         try:
-            for item in os.listdir(path):
-                item_path = os.path.join(path, item)
-                is_dir = os.path.isdir(item_path)
-                
-                item_info = {
-                    "name": item,
-                    "path": item_path,
-                    "type": "directory" if is_dir else "file"
-                }
-                
-                if not is_dir:
+            # os.scandir's DirEntry objects carry the type and stat info
+            # from the directory read itself, avoiding the per-entry
+            # isdir/getsize syscalls os.listdir would require. On Windows
+            # this matters most: is_dir() and stat(follow_symlinks=False)
+            # are answered from the FindFirstFileW/FindNextFileW data, so
+            # no per-file CreateFileW (and no antivirus re-scan of it)
+            # ever happens during the listing
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    # Minimum rendered length: 4-char connector + name +
+                    # newline (prefix, '/', and size strings only add)
+                    if not _take_budget(len(entry.name) + 5):
+                        truncated = True
+                        break
                     try:
-                        item_info["size"] = os.path.getsize(item_path)
-                    except:
-                        item_info["size"] = 0
-                elif depth < 1:  # Only recurse one level
-                    # Recursively list directory contents
-                    item_info["children"] = _list_dir_recursive(item_path, depth + 1)
-                    
-                items.append(item_info)
-                
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        is_dir = False
+
+                    item_info = {
+                        "name": entry.name,
+                        "path": entry.path,
+                        "type": "directory" if is_dir else "file"
+                    }
+
+                    if not is_dir:
+                        try:
+                            item_info["size"] = entry.stat(follow_symlinks=False).st_size
+                        except OSError:
+                            item_info["size"] = 0
+
+                    items.append(item_info)
+
             # Sort: directories first, then files (alphabetically within each group)
             items.sort(key=lambda x: (0 if x["type"] == "directory" else 1, x["name"]))
-            
+
+            if truncated:
+                # Rendered as a trailing "..." file line by the tree builder
+                items.append({"name": "...", "path": path, "type": "file", "size": 0, "truncated": True})
+
         except Exception as e:
             pass
         return items
 
     try:
         path = os.path.normpath(relative_workspace_path)
-        
-        if not os.path.exists(path):
+
+        try:
+            path_stat = os.stat(path)
+        except OSError:
             return False, ""
-            
-        if not os.path.isdir(path):
+
+        if not stat.S_ISDIR(path_stat.st_mode):
             return False, ""
-            
-        items = _list_dir_recursive(path)
-        tree_str = _build_tree_str(items)
 
-        # Apply a global character cap to keep output manageable
-        max_chars = int(os.environ.get("LIST_DIR_MAX_CHARS", DEFAULT_MAX_OUTPUT_CHARS))
-        if len(tree_str) > max_chars:
+        cache_key = (os.path.abspath(path), max_chars)
+        cached = _LIST_DIR_CACHE.get(cache_key)
+        if cached is not None:
+            cached_at, cached_mtime, cached_tree = cached
+            if time.monotonic() - cached_at < _LIST_DIR_TTL and path_stat.st_mtime == cached_mtime:
+                return True, cached_tree
+
+        items = _scan_one_level(path)
+
+        # One level of recursion, as before, but the per-subdirectory scans
+        # are independent syscall-bound work, so overlap them in a small
+        # thread pool; on network filesystems this hides most of the
+        # per-directory latency
+        subdirs = [item for item in items if item["type"] == "directory"]
+        if len(subdirs) == 1:
+            subdirs[0]["children"] = _scan_one_level(subdirs[0]["path"])
+        elif subdirs:
+            with ThreadPoolExecutor(max_workers=min(8, len(subdirs))) as executor:
+                for item, children in zip(subdirs, executor.map(_scan_one_level, [d["path"] for d in subdirs])):
+                    item["children"] = children
+
+        # Apply a global character cap to keep output manageable; consume
+        # the line generator only until the cap is hit so huge trees never
+        # get fully formatted
+        parts = []
+        total_chars = 0
+        for line in _iter_tree_lines(items):
+            parts.append(line)
+            total_chars += len(line)
+            if total_chars > max_chars:
+                break
+        tree_str = "".join(parts)
+        if total_chars > max_chars:
             tree_str = tree_str[:max_chars].rstrip() + f"\n... (output truncated to first {max_chars} characters)\n"
-        
+
+        _LIST_DIR_CACHE[cache_key] = (time.monotonic(), path_stat.st_mtime, tree_str)
         return True, tree_str
         
     except Exception as e:
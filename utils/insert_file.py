@@ -1,6 +1,8 @@
 import os
 from typing import Tuple
 
+from utils.remove_file import _abspath, _count_lines, _line_start_offset
+
 def insert_file(target_file: str, content: str, line_number: int = None) -> Tuple[str, bool]:
     """
     Write or insert content to a target file.
@@ -14,66 +16,85 @@ def insert_file(target_file: str, content: str, line_number: int = None) -> Tupl
         Tuple of (result message, success status)
     """
     try:
-        # Create directories if they don't exist
-        os.makedirs(os.path.dirname(os.path.abspath(target_file)), exist_ok=True)
-        
+        # Create directories if they don't exist; probe first so the
+        # common case (parent already there) costs one stat instead of
+        # makedirs walking the whole path
+        parent_dir = os.path.dirname(_abspath(target_file))
+        if parent_dir and not os.path.isdir(parent_dir):
+            os.makedirs(parent_dir, exist_ok=True)
+
         file_exists = os.path.exists(target_file)
         
         # Complete file replacement or new file creation
         if line_number is None:
-            if file_exists:
-                os.remove(target_file)
-                operation = "replaced"
-            else:
-                operation = "created"
-                
-            # Create the file with new content
-            with open(target_file, 'w', encoding='utf-8') as f:
+            operation = "replaced" if file_exists else "created"
+
+            # Write to a sibling temp file and swap it in atomically, so a
+            # crash mid-write can never leave a truncated target
+            tmp_file = target_file + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
                 f.write(content)
-                
+            os.replace(tmp_file, target_file)
+
             return f"Successfully {operation} {target_file}", True
         
         # Insert at specific line
         else:
             if not file_exists:
-                # If file doesn't exist but line_number is specified, create it with empty lines
-                lines = [''] * max(0, line_number - 1)
+                data = b''
                 operation = "created and inserted into"
             else:
-                # Read existing content
-                with open(target_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
+                # Read the raw bytes once; the insert is a byte splice at
+                # the target line's offset, so no per-line string list is
+                # built and untouched bytes are written back verbatim
+                with open(target_file, 'rb') as f:
+                    data = f.read()
                 operation = "inserted into"
-                
+
             # Ensure line_number is valid
             if line_number < 1:
                 return "Error: Line number must be at least 1", False
-                
+
             # Calculate insert position with 1-indexed to 0-indexed conversion
             position = line_number - 1
-            
-            # If position is beyond the end, pad with newlines
-            while len(lines) < position:
-                lines.append('\n')
-                
+            total_lines = _count_lines(data)
+
             # Ensure content ends with newline to prevent concatenation
             if not content.endswith('\n'):
                 content = content + '\n'
-            
-            # Insert content at specified position
-            if position == len(lines):
-                # Add at the end (may need newline if last line doesn't end with one)
-                if lines and not lines[-1].endswith('\n'):
-                    lines[-1] += '\n'
-                lines.append(content)
-            else:
-                # Split the line at the insertion point if it exists
-                lines.insert(position, content)
-                
-            # Write the updated content
-            with open(target_file, 'w', encoding='utf-8') as f:
-                f.writelines(lines)
-                
+            payload = content.encode('utf-8')
+
+            # Atomic write: build the new bytes in a temp file, then swap
+            tmp_file = target_file + ".tmp"
+            with open(tmp_file, 'wb') as f:
+                if not file_exists:
+                    # Historical quirk kept intact: a brand-new file gets a
+                    # single leading blank line for any position past 1
+                    if position >= 1:
+                        f.write(b'\n')
+                    f.write(payload)
+                elif position > total_lines:
+                    # Appending past the end: pad with blank lines up to
+                    # the requested position (the first pad also terminates
+                    # an unterminated last line)
+                    f.write(data)
+                    f.write(b'\n' * (position - total_lines))
+                    f.write(payload)
+                elif position == total_lines:
+                    # Appending right after the last line; terminate it
+                    # first if it has no trailing newline
+                    f.write(data)
+                    if data and not data.endswith(b'\n'):
+                        f.write(b'\n')
+                    f.write(payload)
+                else:
+                    # Splice before the existing line at the target offset
+                    insert_at = _line_start_offset(data, position)
+                    f.write(data[:insert_at])
+                    f.write(payload)
+                    f.write(data[insert_at:])
+            os.replace(tmp_file, target_file)
+
             return f"Successfully {operation} {target_file} at line {line_number}", True
             
     except Exception as e:
@@ -0,0 +1,141 @@
+"""
+Content-Hash LLM Response Cache
+Wraps call_llm with a SHA-256-keyed on-disk cache so deterministic re-runs
+(same query, same history) skip the network round-trip entirely.
+"""
+
+import hashlib
+import logging
+import os
+from typing import Optional
+
+from utils.call_llm import MODEL, call_llm
+
+logger = logging.getLogger('llm_cache')
+
+# On-disk cache location and byte budget (LRU eviction by access time)
+CACHE_DIR = os.path.expanduser(os.path.join("~", ".cache", "coding_agent", "llm"))
+MAX_CACHE_BYTES = 1024 * 1024 * 1024  # 1 GB
+
+# Model is part of the cache key so responses never leak across model
+# upgrades; imported from call_llm so the salt always matches the model
+# actually queried
+CACHE_MODEL = MODEL
+
+# Only cache deterministic decision-making callers; anything else goes straight
+# to the LLM untouched
+CACHEABLE_CALLERS = {"MainDecisionAgent.exec", "AnalyzeAndPlanNode.exec"}
+
+# Hit/miss counters, logged periodically so cache effectiveness is visible
+_stats = {"hits": 0, "misses": 0}
+_LOG_STATS_EVERY = 20
+
+
+def _cache_key(prompt: str) -> str:
+    """SHA-256 key over (model, prompt) - stable across runs."""
+    return hashlib.sha256((CACHE_MODEL + "\0" + prompt).encode('utf-8')).hexdigest()
+
+
+def _evict_if_needed() -> None:
+    """Evict least-recently-accessed entries once the cache exceeds its budget."""
+    try:
+        entries = []
+        total_bytes = 0
+        for name in os.listdir(CACHE_DIR):
+            path = os.path.join(CACHE_DIR, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+            total_bytes += stat.st_size
+
+        if total_bytes <= MAX_CACHE_BYTES:
+            return
+
+        # Oldest access time first
+        entries.sort()
+        for _, size, path in entries:
+            if total_bytes <= MAX_CACHE_BYTES:
+                break
+            try:
+                os.remove(path)
+                total_bytes -= size
+            except OSError:
+                continue
+    except OSError:
+        # Eviction is best-effort; never fail a call because of it
+        pass
+
+
+def _maybe_log_stats() -> None:
+    lookups = _stats["hits"] + _stats["misses"]
+    if lookups and lookups % _LOG_STATS_EVERY == 0:
+        hit_rate = _stats["hits"] / lookups
+        logger.info(f"LLM cache stats: {_stats['hits']} hits, {_stats['misses']} misses ({hit_rate:.0%} hit rate)")
+
+
+def cached_call_llm(prompt: str, caller: Optional[str] = None, cache_prefix: Optional[str] = None) -> str:
+    """
+    Call the LLM through a content-hash on-disk cache.
+
+    Cache hits short-circuit the network round-trip. Only callers in
+    CACHEABLE_CALLERS are cached; others pass straight through to call_llm.
+    cache_prefix is the provider-side prompt-caching prefix; locally it is
+    part of the hashed key, so keys match the prefix+prompt concatenation.
+    """
+    if caller not in CACHEABLE_CALLERS:
+        return call_llm(prompt, caller=caller, cache_prefix=cache_prefix)
+
+    key = _cache_key((cache_prefix or "") + prompt)
+    path = os.path.join(CACHE_DIR, key)
+
+    # Cache hit - refresh access time for LRU eviction and return
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                response = f.read()
+            os.utime(path, None)
+            _stats["hits"] += 1
+            _maybe_log_stats()
+            logger.debug("Cache hit [%s] for prompt: %.50s...", caller, prompt)
+            return response
+        except OSError:
+            logger.warning(f"Failed to read cache entry, falling through to LLM")
+
+    _stats["misses"] += 1
+    _maybe_log_stats()
+
+    # Miss - call the LLM; this wrapper owns caching for whitelisted callers,
+    # so skip call_llm's own cache
+    response = call_llm(prompt, use_cache=False, caller=caller, cache_prefix=cache_prefix)
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(response)
+        _evict_if_needed()
+    except OSError as e:
+        logger.error(f"Failed to write cache entry: {e}")
+
+    return response
+
+
+def get_cache_stats() -> dict:
+    """Return hit/miss counters for the current process."""
+    return dict(_stats)
+
+
+if __name__ == "__main__":
+    # Two identical calls: the second should be served from the on-disk cache
+    test_prompt = "Hello, how are you?"
+
+    print("Making first call (expect cache miss)...")
+    response1 = cached_call_llm(test_prompt, caller="MainDecisionAgent.exec")
+    print(f"Response: {response1[:100]}")
+
+    print("\nMaking second call (expect cache hit)...")
+    response2 = cached_call_llm(test_prompt, caller="MainDecisionAgent.exec")
+    print(f"Response: {response2[:100]}")
+
+    print(f"\nCache stats: {get_cache_stats()}")
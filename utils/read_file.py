@@ -1,4 +1,5 @@
 import os
+from itertools import islice
 from typing import Tuple, Optional
 
 def read_file(
@@ -21,18 +22,23 @@ def read_file(
         Tuple of (file content with line numbers, success status)
     """
     try:
-        if not os.path.exists(target_file):
-            return f"Error: File {target_file} does not exist", False
-        
         # If only target_file is provided or any line parameter is None, read the entire file
         if start_line_one_indexed is None or end_line_one_indexed_inclusive is None:
             should_read_entire_file = True
-        
-        with open(target_file, 'r', encoding='utf-8') as f:
+
+        # Open directly rather than probing with os.path.exists first:
+        # one syscall instead of two, and no window for the file to
+        # vanish between the check and the open
+        try:
+            f = open(target_file, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return f"Error: File {target_file} does not exist", False
+
+        with f:
             if should_read_entire_file:
-                lines = f.readlines()
-                # Add line numbers to each line
-                numbered_lines = [f"{i+1}: {line}" for i, line in enumerate(lines)]
+                # Number lines straight off the file iterator; no
+                # intermediate readlines() list is materialized
+                numbered_lines = [f"{i}: {line}" for i, line in enumerate(f, start=1)]
                 return ''.join(numbered_lines), True
             
             # Validate line range parameters
@@ -46,22 +52,26 @@ def read_file(
             if end_line_one_indexed_inclusive - start_line_one_indexed + 1 > 250:
                 return "Error: Cannot read more than 250 lines at once", False
             
-            # Read the specified lines
-            lines = f.readlines()
-            
             # Adjust for one-indexed to zero-indexed
             start_idx = start_line_one_indexed - 1
             end_idx = end_line_one_indexed_inclusive - 1
-            
-            # Check if the requested range is out of bounds
-            if start_idx >= len(lines):
-                return f"Error: start_line_one_indexed ({start_line_one_indexed}) exceeds file length ({len(lines)})", False
-            
-            end_idx = min(end_idx, len(lines) - 1)
-            
-            # Add line numbers to the selected lines
-            numbered_lines = [f"{i+1}: {lines[i]}" for i in range(start_idx, end_idx + 1)]
-            
+
+            # Read lazily up to end_idx; the tail of the file past the
+            # requested range is never touched, so I/O scales with the
+            # end line rather than the file size
+            numbered_lines = []
+            lines_seen = 0
+            for line in islice(f, end_idx + 1):
+                lines_seen += 1
+                if lines_seen > start_idx:
+                    numbered_lines.append(f"{lines_seen}: {line}")
+
+            # Check if the requested range is out of bounds; when the
+            # iterator runs dry before start_idx, lines_seen is the full
+            # file length
+            if not numbered_lines:
+                return f"Error: start_line_one_indexed ({start_line_one_indexed}) exceeds file length ({lines_seen})", False
+
             return ''.join(numbered_lines), True
             
     except Exception as e:
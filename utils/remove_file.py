@@ -1,6 +1,40 @@
 import os
+from functools import lru_cache
 from typing import Tuple
 
+
+@lru_cache(maxsize=4096)
+def _abspath(path: str) -> str:
+    """Memoized os.path.abspath. Agent sessions hit the same few target
+    files over and over, and the mapping is deterministic for a given cwd
+    (the agent never chdirs between edits), so the getcwd + normpath
+    cascade is paid once per distinct path."""
+    return os.path.abspath(path)
+
+
+def _count_lines(data: bytes) -> int:
+    """Number of lines as readlines() would report (a trailing unterminated
+    line counts)."""
+    if not data:
+        return 0
+    return data.count(b'\n') + (0 if data.endswith(b'\n') else 1)
+
+
+def _line_start_offset(data: bytes, line_index: int) -> int:
+    """
+    Byte offset where 0-indexed line line_index starts. Scans newline
+    positions instead of materializing a per-line string list; returns
+    len(data) when line_index is past the last line.
+    """
+    offset = 0
+    for _ in range(line_index):
+        nl = data.find(b'\n', offset)
+        if nl == -1:
+            return len(data)
+        offset = nl + 1
+    return offset
+
+
 def remove_file(target_file: str, start_line: int = None, end_line: int = None) -> Tuple[str, bool]:
     """
     Remove content from a file based on line numbers.
@@ -24,38 +58,44 @@ def remove_file(target_file: str, start_line: int = None, end_line: int = None)
         if start_line is None and end_line is None:
             return "Error: At least one of start_line or end_line must be specified", False
         
-        # Read the file content
-        with open(target_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
+        # Read the raw bytes once; the removal is a byte-range splice, so
+        # no per-line string list is ever materialized and untouched bytes
+        # (including their line endings) are written back verbatim
+        with open(target_file, 'rb') as f:
+            data = f.read()
+        total_lines = _count_lines(data)
+
         # Validate line numbers
         if start_line is not None and start_line < 1:
             return "Error: start_line must be at least 1", False
-        
+
         if end_line is not None and end_line < 1:
             return "Error: end_line must be at least 1", False
-        
+
         if start_line is not None and end_line is not None and start_line > end_line:
             return "Error: start_line must be less than or equal to end_line", False
-        
+
         # Adjust for 1-indexed to 0-indexed
         start_idx = start_line - 1 if start_line is not None else 0
-        end_idx = end_line - 1 if end_line is not None else len(lines) - 1
-        
+        end_idx = end_line - 1 if end_line is not None else total_lines - 1
+
         # Don't report error if start_line is beyond file length
         # Just return success with a message indicating no lines were removed
-        if start_idx >= len(lines):
-            return f"No lines removed: start_line ({start_line}) exceeds file length ({len(lines)})", True
-        
+        if start_idx >= total_lines:
+            return f"No lines removed: start_line ({start_line}) exceeds file length ({total_lines})", True
+
         # If end_line goes beyond file length, just remove to the end of the file
-        end_idx = min(end_idx, len(lines) - 1)
-        
-        # Remove the specified lines
-        del lines[start_idx:end_idx + 1]
-        
-        # Write the updated content back to the file
-        with open(target_file, 'w', encoding='utf-8') as f:
-            f.writelines(lines)
+        end_idx = min(end_idx, total_lines - 1)
+
+        # Remove the specified byte range in a single write; the temp file
+        # plus atomic swap means a crash can never leave a truncated target
+        removal_start = _line_start_offset(data, start_idx)
+        removal_end = _line_start_offset(data, end_idx + 1)
+        tmp_file = target_file + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(data[:removal_start])
+            f.write(data[removal_end:])
+        os.replace(tmp_file, target_file)
         
         # Prepare message based on what was removed
         if start_line is None:
@@ -1,18 +1,21 @@
 import os
 from typing import Tuple
-from utils.remove_file import remove_file
-from utils.insert_file import insert_file
+from utils.remove_file import _abspath, _count_lines, _line_start_offset
 
 def replace_file(target_file: str, start_line: int, end_line: int, content: str) -> Tuple[str, bool]:
     """
     Replace content in a file between specified line numbers.
-    
+
+    The removal and insertion are fused into one read and one write: the
+    old remove_file + insert_file sequence read and rewrote the file twice
+    per edit and left a window where it was only half modified.
+
     Args:
         target_file: Path to the file to modify
         start_line: Starting line number to replace (1-indexed)
         end_line: Ending line number to replace (1-indexed, inclusive)
         content: The new content to replace the specified lines with
-    
+
     Returns:
         Tuple of (result message, success status)
     """
@@ -20,36 +23,60 @@ def replace_file(target_file: str, start_line: int, end_line: int, content: str)
     try:
         # Create file if it doesn't exist
         if not os.path.exists(target_file):
-            # Create directories if they don't exist
-            os.makedirs(os.path.dirname(os.path.abspath(target_file)), exist_ok=True)
+            # Create directories if they don't exist (probe first; the
+            # parent usually already exists)
+            parent_dir = os.path.dirname(_abspath(target_file))
+            if parent_dir and not os.path.isdir(parent_dir):
+                os.makedirs(parent_dir, exist_ok=True)
             # Create empty file
             with open(target_file, 'w', encoding='utf-8') as f:
                 pass
-        
+
         # Validate line numbers
         if start_line < 1:
             return "Error: start_line must be at least 1", False
-        
+
         if end_line < 1:
             return "Error: end_line must be at least 1", False
-        
+
         if start_line > end_line:
             return "Error: start_line must be less than or equal to end_line", False
-        
-        # First, remove the specified lines
-        remove_result, remove_success = remove_file(target_file, start_line, end_line)
-        
-        if not remove_success:
-            return f"Error during remove step: {remove_result}", False
-        
-        # Then, insert the new content at the start line
-        insert_result, insert_success = insert_file(target_file, content, start_line)
-        
-        if not insert_success:
-            return f"Error during insert step: {insert_result}", False
-        
+
+        with open(target_file, 'rb') as f:
+            data = f.read()
+        total_lines = _count_lines(data)
+
+        # Ensure content ends with newline to prevent concatenation
+        if not content.endswith('\n'):
+            content = content + '\n'
+        payload = content.encode('utf-8')
+
+        start_idx = start_line - 1
+        end_idx = min(end_line - 1, total_lines - 1)
+
+        # Atomic write: build the new bytes in a temp file, then swap
+        tmp_file = target_file + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            if start_idx >= total_lines:
+                # Nothing to remove; behaves like an insert past the end,
+                # padding with blank lines up to the requested position
+                f.write(data)
+                if start_idx == total_lines and data and not data.endswith(b'\n'):
+                    f.write(b'\n')
+                f.write(b'\n' * (start_idx - total_lines))
+                f.write(payload)
+            else:
+                # Single splice: everything before the replaced range, the
+                # new content, then everything after it
+                removal_start = _line_start_offset(data, start_idx)
+                removal_end = _line_start_offset(data, end_idx + 1)
+                f.write(data[:removal_start])
+                f.write(payload)
+                f.write(data[removal_end:])
+        os.replace(tmp_file, target_file)
+
         return f"Successfully replaced lines {start_line} to {end_line} in {target_file}", True
-        
+
     except Exception as e:
         return f"Error replacing content: {str(e)}", False
 
@@ -6,11 +6,41 @@ Executes shell commands with proper error handling and output capture.
 import subprocess
 import logging
 import os
+import shlex
+import signal
+import threading
 import time
+from collections import deque
 from typing import Tuple
 
 logger = logging.getLogger('run_command')
 
+# Cap on retained output: keep only the most recent lines per stream so
+# chatty or long-running commands cannot grow memory without bound
+MAX_OUTPUT_LINES = 2000
+
+# Commands containing any of these need a real shell (pipes, redirects,
+# globs, substitutions, tilde expansion); anything else runs as a plain
+# argv
+_SHELL_METACHARACTERS = set('|&;<>$`*?[](){}~')
+
+# Approval-prompt constants, hoisted so the interactive loop doesn't
+# rebuild them on every call/iteration
+_BANNER_LINE = '=' * 60
+_YES_RESPONSES = frozenset({'y', 'yes'})
+_NO_RESPONSES = frozenset({'n', 'no', ''})
+_DETAIL_RESPONSES = frozenset({'d', 'details', 'detail'})
+
+
+def _drain_stream(stream, buffer: deque, counter: list) -> None:
+    """Read a subprocess pipe line by line into a bounded ring buffer."""
+    try:
+        for line in stream:
+            buffer.append(line)
+            counter[0] += 1
+    finally:
+        stream.close()
+
 def run_command(command: str, working_dir: str = None, timeout: int = 30) -> Tuple[bool, str]:
     """
     Execute a shell command and return the result.
@@ -30,7 +60,6 @@ def run_command(command: str, working_dir: str = None, timeout: int = 30) -> Tup
         # Special handling for streamlit commands
         if "streamlit run" in command.lower():
             # For streamlit, run in background and don't capture output to allow browser opening
-            import threading
             import webbrowser
             
             def run_streamlit():
@@ -48,38 +77,90 @@ def run_command(command: str, working_dir: str = None, timeout: int = 30) -> Tup
             
             return True, f"Streamlit application started successfully!\nCommand: {command}\nAccess at: http://localhost:8501\nThe application is running in the background."
         
-        # Run the command normally for non-streamlit commands
-        result = subprocess.run(
-            command,
-            shell=True,
-            capture_output=True,
+        # Simple commands run without a shell: shlex.split yields the argv
+        # directly, skipping the /bin/sh fork and letting the timeout kill
+        # reach the real process instead of a shell wrapper. Anything with
+        # shell metacharacters keeps the shell path
+        use_shell = any(c in _SHELL_METACHARACTERS for c in command)
+        args = command
+        if not use_shell:
+            try:
+                args = shlex.split(command)
+            except ValueError:
+                # Unbalanced quotes etc. — let the shell sort it out
+                use_shell = True
+                args = command
+            else:
+                # Empty commands and leading FOO=bar environment
+                # assignments also need the shell
+                if not args or '=' in args[0]:
+                    use_shell = True
+                    args = command
+
+        # Run the command, streaming the output through bounded ring
+        # buffers instead of materializing it all. start_new_session puts
+        # the child in its own process group so a timeout can kill the
+        # whole tree, not just the immediate child
+        process = subprocess.Popen(
+            args,
+            shell=use_shell,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
             cwd=working_dir,
-            timeout=timeout
+            start_new_session=True
         )
-        
-        # Combine stdout and stderr
+
+        stdout_lines = deque(maxlen=MAX_OUTPUT_LINES)
+        stderr_lines = deque(maxlen=MAX_OUTPUT_LINES)
+        stdout_count = [0]
+        stderr_count = [0]
+
+        stdout_thread = threading.Thread(target=_drain_stream, args=(process.stdout, stdout_lines, stdout_count), daemon=True)
+        stderr_thread = threading.Thread(target=_drain_stream, args=(process.stderr, stderr_lines, stderr_count), daemon=True)
+        stdout_thread.start()
+        stderr_thread.start()
+
+        try:
+            returncode = process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            # Kill the whole process group so grandchildren (or the shell's
+            # children on the shell path) don't outlive the timeout
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except (OSError, AttributeError):
+                process.kill()
+            process.wait()
+            error_msg = f"Command timed out after {timeout} seconds"
+            logger.error(error_msg)
+            return False, error_msg
+
+        stdout_thread.join()
+        stderr_thread.join()
+
+        # Combine stdout and stderr, noting any truncated head
         output = ""
-        if result.stdout:
-            output += f"STDOUT:\n{result.stdout}"
-        if result.stderr:
+        if stdout_lines:
+            output += "STDOUT:\n"
+            if stdout_count[0] > MAX_OUTPUT_LINES:
+                output += f"... (output truncated to last {MAX_OUTPUT_LINES} of {stdout_count[0]} lines)\n"
+            output += "".join(stdout_lines)
+        if stderr_lines:
             if output:
                 output += "\n\n"
-            output += f"STDERR:\n{result.stderr}"
-        
-        if result.returncode == 0:
-            logger.info(f"Command executed successfully. Return code: {result.returncode}")
+            output += "STDERR:\n"
+            if stderr_count[0] > MAX_OUTPUT_LINES:
+                output += f"... (output truncated to last {MAX_OUTPUT_LINES} of {stderr_count[0]} lines)\n"
+            output += "".join(stderr_lines)
+
+        if returncode == 0:
+            logger.info(f"Command executed successfully. Return code: {returncode}")
             logger.info(f"Command output: {output}")
             return True, output or f"Command executed successfully (no output)"
         else:
-            logger.error(f"Command failed with return code: {result.returncode}")
+            logger.error(f"Command failed with return code: {returncode}")
             logger.error(f"Command output: {output}")
-            return False, f"Command failed (exit code {result.returncode}):\n{output}"
-            
-    except subprocess.TimeoutExpired:
-        error_msg = f"Command timed out after {timeout} seconds"
-        logger.error(error_msg)
-        return False, error_msg
+            return False, f"Command failed (exit code {returncode}):\n{output}"
         
     except subprocess.CalledProcessError as e:
         error_msg = f"Command failed: {e}"
@@ -102,12 +183,12 @@ def get_user_approval(command: str, reason: str) -> bool:
     Returns:
         bool: True if user approves, False otherwise
     """
-    print(f"\n{'='*60}")
+    print(f"\n{_BANNER_LINE}")
     print(f"🤖 AI wants to run a command:")
-    print(f"{'='*60}")
+    print(_BANNER_LINE)
     print(f"Command: {command}")
     print(f"Reason:  {reason}")
-    print(f"{'='*60}")
+    print(_BANNER_LINE)
     import sys
     sys.stdout.flush()  # Ensure prompt is displayed immediately
     
@@ -115,13 +196,13 @@ def get_user_approval(command: str, reason: str) -> bool:
         try:
             response = input("Do you approve this command? [y/N/details]: ").strip().lower()
             
-            if response in ['y', 'yes']:
+            if response in _YES_RESPONSES:
                 print("✅ Command approved by user")
                 return True
-            elif response in ['n', 'no', '']:
+            elif response in _NO_RESPONSES:
                 print("❌ Command rejected by user")
                 return False
-            elif response in ['d', 'details', 'detail']:
+            elif response in _DETAIL_RESPONSES:
                 print(f"\n📋 Command Details:")
                 print(f"Working Directory: {os.getcwd()}")
                 print(f"Command Type: Shell command")
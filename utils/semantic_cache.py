@@ -0,0 +1,140 @@
+"""
+Semantic LLM Response Cache
+Optional fuzzy cache layer: embeds prompts once and serves the stored
+response of the nearest neighbour when cosine similarity clears a threshold,
+so rephrased queries stop missing the exact-string cache.
+
+Requires sentence-transformers and numpy; without them (or without
+LLM_SEMANTIC_CACHE=1 in the environment) the layer quietly disables itself.
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+logger = logging.getLogger('semantic_cache')
+
+# Optional dependencies: the cache is a no-op when they are missing
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+    _AVAILABLE = True
+except ImportError:
+    _AVAILABLE = False
+
+# Top-1 cosine similarity must clear this to count as a hit; conservative so
+# a paraphrase match never swaps in an unrelated answer
+SIMILARITY_THRESHOLD = 0.92
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDINGS_FILE = "llm_semantic_cache.npy"
+RESPONSES_FILE = "llm_semantic_cache.jsonl"
+
+_lock = threading.Lock()
+_model = None
+_embeddings = None  # (N, 384) unit-normalized prompt embeddings
+_responses = None   # responses[i] answers the prompt behind _embeddings[i]
+
+
+def is_enabled() -> bool:
+    """True when the optional deps are importable and the env flag is set."""
+    return _AVAILABLE and os.getenv("LLM_SEMANTIC_CACHE") == "1"
+
+
+def _get_model():
+    global _model
+    if _model is None:
+        _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+
+def _load_state() -> None:
+    """Load the persisted embeddings/responses once per process."""
+    global _embeddings, _responses
+
+    if _responses is not None:
+        return
+
+    if os.path.exists(EMBEDDINGS_FILE) and os.path.exists(RESPONSES_FILE):
+        try:
+            _embeddings = np.load(EMBEDDINGS_FILE)
+            with open(RESPONSES_FILE, 'r', encoding='utf-8') as f:
+                _responses = [json.loads(line)["r"] for line in f]
+            if len(_responses) != len(_embeddings):
+                raise ValueError("embedding/response count mismatch")
+            return
+        except Exception as e:
+            logger.warning(f"Failed to load semantic cache, starting empty: {e}")
+
+    _embeddings = np.empty((0, 384), dtype=np.float32)
+    _responses = []
+
+
+def _embed(prompt: str):
+    """Unit-normalized embedding so cosine similarity is a dot product."""
+    vec = _get_model().encode([prompt])[0].astype(np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def lookup(prompt: str) -> Optional[str]:
+    """Return the nearest cached response if it clears the threshold."""
+    if not is_enabled():
+        return None
+
+    with _lock:
+        _load_state()
+        if not _responses:
+            return None
+
+        sims = _embeddings @ _embed(prompt)
+        idx = int(sims.argmax())
+        if sims[idx] >= SIMILARITY_THRESHOLD:
+            logger.debug(f"Semantic cache hit (similarity {sims[idx]:.3f}) for prompt: {prompt[:50]}...")
+            return _responses[idx]
+
+    return None
+
+
+def store(prompt: str, response: str) -> None:
+    """Add a prompt/response pair and persist the cache."""
+    if not is_enabled():
+        return
+
+    with _lock:
+        _load_state()
+        global _embeddings
+        _embeddings = np.vstack([_embeddings, _embed(prompt)])
+        _responses.append(response)
+
+        try:
+            np.save(EMBEDDINGS_FILE, _embeddings)
+            with open(RESPONSES_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"p": prompt[:200], "r": response}) + "\n")
+        except Exception as e:
+            logger.error(f"Failed to persist semantic cache: {e}")
+
+
+def clear() -> None:
+    """Drop the in-memory state and persisted files."""
+    global _embeddings, _responses
+    with _lock:
+        _embeddings = None
+        _responses = None
+        for path in (EMBEDDINGS_FILE, RESPONSES_FILE):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    if not _AVAILABLE:
+        print("sentence-transformers/numpy not installed - semantic cache disabled")
+    else:
+        os.environ["LLM_SEMANTIC_CACHE"] = "1"
+        store("How do I list the files in a directory?", "Use os.listdir or os.scandir.")
+
+        print("Exact phrasing:", lookup("How do I list the files in a directory?"))
+        print("Rephrased:", lookup("What's the way to list a directory's files?"))
+        print("Unrelated:", lookup("Explain the borrow checker in Rust."))